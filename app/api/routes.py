@@ -2,16 +2,31 @@ import websockets
 import uuid
 import json
 import logging
-from fastapi import APIRouter, HTTPException, Query, Request, File, UploadFile, Form
-from fastapi.responses import JSONResponse, StreamingResponse
-from app.services.comfyui import queue_prompt, track_progress, get_image
-from app.models.schemas import ComfyUIPrompt, HistoryResponse, ProgressResponse, ImageResponse
-import websocket 
-import io
-import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, File, UploadFile, Form
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from app.services.comfyui import comfyui_client
+from app.services.comfyui_events import ComfyUIExecutionError, track_progress
+from app.services.backend_pool import backend_pool, NoHealthyBackendError
+from app.services.generation import run_workflow, output_images, workflow_flights
+from app.services.jobs import job_manager, JobQueueFullError
+from app.services.scheduler import PRIORITIES, SchedulerTimeoutError, scheduler
+from app.services.image_cache import cache_key, image_cache
+from app.services.workflows import (
+    INPAINT_REQUIRED_ROLES, INPAINT_ROLES, WorkflowTemplate, workflow_models, workflow_registry, with_batch_size,
+    with_seed_variants
+)
+from app.services.uploads import upload_tracker
+from app.services.edit_sessions import CachedNodeCollector, EditSession, edit_sessions
+from app.services.transcode import TranscodeOptions, TranscoderUnavailableError, transcoder
+from app.utils.zipstream import stream_zip
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.schemas import ComfyUIPrompt, HistoryResponse, ProgressResponse, ImageResponse, WorkflowRegistration
 import asyncio
-import requests
-server = "damage-romantic-environmental-rome.trycloudflare.com"
+import hashlib
+import httpx
+from typing import Optional
+server = settings.SERVER_ADDRESS
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
@@ -32,34 +47,63 @@ async def connect_to_comfy(server_address: str):
         logger.error(f"Unexpected error connecting to {uri}: ${str(e)}")
         raise HTTPException(status_code=500, detail=f"WebSocket connection failed: ${str(e)}")
 
+# Prompts queued through /queue_prompt, each holding its scheduler slot until ComfyUI finishes it.
+_queued_prompts: set = set()
+
 @router.post("/queue_prompt")
-async def queue_prompt_route(prompt_data: dict):
-    server_address = server
-    client_id = str(uuid.uuid4())
+async def queue_prompt_route(prompt_data: dict, request: Request):
+    """Queues a raw workflow in the batch class and returns once ComfyUI accepted it.
+
+    The scheduler slot stays taken until the prompt finishes, so scripts queueing through here
+    are held to the same priority, quota and per-backend limits as every other request.
+    """
     prompt = prompt_data.get("workflow_data", {})
 
-    if not prompt or not server_address:
+    if not prompt:
         raise HTTPException(status_code=400, detail="Missing required parameters")
 
+    client_id, priority = _requester(request, "batch")
+    queued = asyncio.get_running_loop().create_future()
+
+    async def run():
+        async with scheduler.slot(client_id, priority, workflow_models(prompt)) as backend:
+            def on_queued(prompt_id: str):
+                if not queued.done():
+                    queued.set_result((backend.address, prompt_id))
+            await run_workflow(prompt, backend=backend, on_queued=on_queued)
+
+    def finished(task: asyncio.Task):
+        _queued_prompts.discard(task)
+        error = None if task.cancelled() else task.exception()
+        if not queued.done():
+            if error is None:
+                queued.cancel()
+            else:
+                queued.set_exception(error)
+        elif error is not None:
+            logger.warning(f"Prompt queued through /queue_prompt failed: {error}")
+
+    task = asyncio.create_task(run())
+    _queued_prompts.add(task)
+    task.add_done_callback(finished)
     try:
-        payload = {"prompt": prompt, "client_id": client_id}
-        logger.info(f"Sending to ComfyUI /prompt: ${json.dumps(payload)}")
-        response = requests.post(
-            f"http://{server_address}/prompt",
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            timeout=10
+        server_address, prompt_id = await asyncio.shield(queued)
+        return JSONResponse(
+            content={"message": "Prompt queued successfully", "prompt_id": prompt_id, "server_address": server_address},
+            status_code=200
         )
-        response.raise_for_status()
-        result = response.json()
-        logger.info(f"ComfyUI response: ${result}")
-        prompt_id = result.get("prompt_id")
-        if not prompt_id:
-            raise HTTPException(status_code=500, detail="Failed to get prompt_id from ComfyUI")
-        return JSONResponse(content={"message": "Prompt queued successfully", "prompt_id": prompt_id}, status_code=200)
-    except requests.exceptions.RequestException as e:
+    except asyncio.CancelledError:
+        # The caller went away before ComfyUI had the prompt; give the slot back.
+        if not queued.done():
+            task.cancel()
+        raise
+    except (NoHealthyBackendError, SchedulerTimeoutError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ComfyUIExecutionError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except httpx.HTTPError as e:
         logger.error(f"Error queuing prompt: ${str(e)}")
-        if hasattr(e, 'response') and e.response is not None:
+        if isinstance(e, httpx.HTTPStatusError):
             logger.error(f"ComfyUI response body: ${e.response.text}")
         raise HTTPException(status_code=500, detail=f"Error queuing prompt: ${str(e)}")
     
@@ -67,25 +111,70 @@ async def queue_prompt_route(prompt_data: dict):
 async def create_prompt(request_data: dict):
     if not request_data.get("post_type") or request_data["post_type"] not in post_type_prompts:
         raise HTTPException(status_code=400, detail="Invalid post_type.")
-    
+    if request_data.get("prompt_engine") not in (None, *PROMPT_ENGINES):
+        raise HTTPException(status_code=400, detail=f"prompt_engine must be one of: {', '.join(PROMPT_ENGINES)}")
+    budget = request_data.get("latency_budget")
+    if budget is not None and (isinstance(budget, bool) or not isinstance(budget, (int, float)) or budget <= 0):
+        raise HTTPException(status_code=400, detail="latency_budget must be a positive number of seconds")
+
     result = await generate_prompt(request_data)
-    logger.info(f"Generated prompt: ${result['generated_prompt']}")
+    logger.debug(f"Generated prompt: {result['generated_prompt']}")
     return result
 
 @router.get("/get_history")
 async def get_history(server_address: str = Query(server)):
     try:
-        response = requests.get(f"http://{server_address}/history")
-        response.raise_for_status()
-        return HistoryResponse(all_prompts=response.json())
-    except requests.exceptions.RequestException as e:
+        history = await comfyui_client.get_history(server_address)
+        return HistoryResponse(all_prompts=history)
+    except httpx.HTTPError as e:
         logger.error(f"Error fetching history: ${str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/workflows")
+async def list_workflows():
+    """Lists the preloaded workflow templates and the roles each one can patch."""
+    return {"workflows": workflow_registry.list()}
+
+@router.post("/workflows", status_code=201)
+async def register_workflow(registration: WorkflowRegistration):
+    """Registers a custom workflow once so later requests can refer to it by name.
+
+    ``roles`` maps role names (positive_text, image, mask, ...) to [node id, input name].
+    """
+    try:
+        template = workflow_registry.register_custom(
+            registration.workflow, registration.roles, registration.output_node, registration.name
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return template.to_dict()
+
+@router.get("/backends")
+async def get_backends():
+    """Reports health and queue depth of every configured ComfyUI backend."""
+    return {"backends": backend_pool.status()}
+
+@router.get("/scheduler")
+async def get_scheduler():
+    """Backend slots in use, queued requests per priority class and per-client usage."""
+    return scheduler.status()
+
+@router.get("/inpaint/sessions")
+async def list_edit_sessions():
+    """Inpaint edit sessions, newest first, with totals of how many nodes ComfyUI reused."""
+    return {"stats": edit_sessions.get_stats(), "sessions": edit_sessions.list()}
+
+@router.get("/inpaint/sessions/{session_id}")
+async def get_edit_session(session_id: str):
+    session = edit_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown edit session {session_id}")
+    return session.to_dict()
+
 @router.get("/track_progress/{prompt_id}")
 async def track_progress_route(prompt_id: str, server_address: str = Query(server)):
     try:
-        progress = track_progress(server_address, prompt_id)
+        progress = await track_progress(server_address, prompt_id)
         if "error" in progress:
             raise HTTPException(status_code=500, detail=progress["error"])
         return ProgressResponse(status="completed", message=f"Prompt {prompt_id} completed")
@@ -93,65 +182,376 @@ async def track_progress_route(prompt_id: str, server_address: str = Query(serve
         logger.error(f"Error tracking progress: ${str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
     
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+def _byte_range(request: Request, etag: str, size: int):
+    """The (start, end) of a single satisfiable ``Range`` request, None to send everything.
+
+    Raises ValueError for a range outside the body; multiple ranges and stale ``If-Range``
+    validators fall back to the whole body, which RFC 9110 allows.
+    """
+    header = request.headers.get("range", "")
+    if_range = request.headers.get("if-range")
+    if not header.startswith("bytes=") or "," in header or (if_range is not None and if_range.strip() != etag):
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    if not (first or last) or not (first or "0").isdigit() or not (last or "0").isdigit():
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end or size == 0:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, end
+
+def _cached_image_response(request: Request, data: bytes, etag: str, headers: dict, media_type: str = "image/png"):
+    """Serves bytes from the image cache with the same 304/206/416 handling as relayed images."""
+    headers = {**headers, "ETag": etag, "Accept-Ranges": "bytes"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        byte_range = _byte_range(request, etag, len(data))
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{len(data)}"})
+    if byte_range is None:
+        return Response(content=data, media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+    return Response(content=data[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+async def _stream_image(
+    request: Request,
+    server_address: str,
+    filename: str,
+    subfolder: str = "",
+    folder_type: str = "output",
+    cache_to: str = None,
+):
+    """Relays a ComfyUI /view response chunk by chunk, passing Range and conditional headers on.
+
+    ComfyUI reuses output names once its output folder is cleaned, so validators are ComfyUI's
+    own (derived from the file) and every use is revalidated against it.
+    With ``cache_to`` a complete (200) response is also stored in the image cache under that key.
+    """
+    upstream_headers = {
+        name: request.headers[name]
+        for name in ("range", "if-range", "if-none-match", "if-modified-since")
+        if name in request.headers
+    }
+
+    try:
+        upstream = await comfyui_client.open_view(server_address, filename, subfolder, folder_type, headers=upstream_headers)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 304:
+            headers = {name: e.response.headers[name] for name in ("etag", "last-modified") if name in e.response.headers}
+            return Response(status_code=304, headers={**headers, "Cache-Control": "private, no-cache"})
+        if e.response.status_code == 416:
+            return Response(status_code=416, headers={"Content-Range": e.response.headers.get("content-range", "")})
+        raise
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f"attachment; filename={filename}",
+    }
+    for name in ("etag", "last-modified", "content-length", "content-range", "content-encoding"):
+        if name in upstream.headers:
+            headers[name] = upstream.headers[name]
+    chunks = [] if cache_to and upstream.status_code == 200 and "content-encoding" not in upstream.headers else None
+
+    async def body():
+        try:
+            async for chunk in upstream.aiter_raw():
+                if chunks is not None:
+                    chunks.append(chunk)
+                yield chunk
+        finally:
+            await upstream.aclose()
+        if chunks is not None:
+            await image_cache.put(cache_to, b"".join(chunks))
+
+    return StreamingResponse(
+        body(),
+        status_code=upstream.status_code,
+        media_type=upstream.headers.get("content-type", "image/png"),
+        headers=headers
+    )
+
+def _output_options(
+    format: Optional[str] = Query(None, regex="^(webp|jpeg|jpg|png)$"),
+    quality: int = Query(settings.TRANSCODE_QUALITY, ge=1, le=100),
+    size: Optional[int] = Query(None, ge=16, le=settings.TRANSCODE_MAX_SIZE),
+    thumbnail: bool = Query(False),
+) -> Optional[TranscodeOptions]:
+    """Query parameters selecting a re-encoded variant; ``None`` keeps ComfyUI's original PNG."""
+    if format is None and size is None and not thumbnail:
+        return None
+    return TranscodeOptions(format or "webp", quality, settings.THUMBNAIL_SIZE if thumbnail else size)
+
+async def _variant_response(request: Request, source_key: str, load, options: TranscodeOptions, name: str):
+    """Serves a cached or freshly encoded variant of the source image identified by ``source_key``."""
+    etag = f'"{transcoder.variant_key(source_key, options)}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Content-Disposition": f"attachment; filename={name}.{options.extension}",
+    }
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        data = await transcoder.transcode(source_key, load, options)
+    except TranscoderUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return Response(content=data, media_type=options.media_type, headers=headers)
+
+async def _view_variant(request: Request, server_address: str, image: dict, options: TranscodeOptions, cache_to: str = None):
+    """Encodes a ComfyUI output; with ``cache_to`` the downloaded original also goes into the image cache.
+
+    Without ``cache_to`` the original is downloaded first and variants are keyed by its sha256:
+    ComfyUI reuses output names once its output folder is cleaned, so a location never
+    identifies the bytes behind it.
+    """
+    filename, subfolder, folder_type = image["filename"], image.get("subfolder", ""), image.get("type", "output")
+
+    if cache_to:
+        async def load() -> bytes:
+            data = await comfyui_client.view(server_address, filename, subfolder, folder_type)
+            await image_cache.put(cache_to, data)
+            return data
+        source_key = cache_to
+    else:
+        source = await comfyui_client.view(server_address, filename, subfolder, folder_type)
+
+        async def load() -> bytes:
+            return source
+        source_key = hashlib.sha256(source).hexdigest()
+
+    return await _variant_response(request, source_key, load, options, filename.rsplit(".", 1)[0])
+
 @router.get("/get_image")
-async def get_image_route(filename: str = Query(...), server_address: str = Query(server)):
+async def get_image_route(
+    request: Request,
+    filename: str = Query(...),
+    server_address: str = Query(server),
+    subfolder: str = Query(""),
+    type: str = Query("output"),
+    options: Optional[TranscodeOptions] = Depends(_output_options)
+):
     try:
-        image_data = get_image(server_address, filename)
-        if "error" in image_data:
-            raise HTTPException(status_code=500, detail=image_data["error"])
-        return StreamingResponse(
-            io.BytesIO(image_data["image_data"]),
-            media_type="image/png",
-            headers={"Content-Disposition": f"attachment; filename=${image_data['filename']}"}
-        )
+        if options is not None:
+            image = {"filename": filename, "subfolder": subfolder, "type": type}
+            return await _view_variant(request, server_address, image, options)
+        return await _stream_image(request, server_address, filename, subfolder, type)
+    except HTTPException:
+        raise
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching image: ${str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _requester(request: Request, endpoint_priority: str = "interactive"):
+    """Scheduling identity of a request: ``X-Client-Id`` (else the peer address) and its class.
+
+    The class comes from the endpoint; ``X-Priority`` can only lower it, so a bulk client cannot
+    promote its work by labelling itself interactive.
+    """
+    client_id = request.headers.get("x-client-id") or (request.client.host if request.client else "anonymous")
+    priority = request.headers.get("x-priority", endpoint_priority).lower()
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"X-Priority must be one of: {', '.join(PRIORITIES)}")
+    return client_id, max(priority, endpoint_priority, key=PRIORITIES.index)
+
+def _load_workflow(request_data: dict) -> dict:
+    """Returns the request's workflow_data, falling back to a copy of the tutorial workflow."""
+    workflow_data = request_data.get("workflow_data")
+    if not workflow_data:
+        workflow_data = workflow_registry.get("tutorial").render()
+    return workflow_data
+
 @router.post("/generate_image")
-async def generate_image(request_data: dict):
-    """Handles full process: Queue Prompt → Track Progress → Get Image."""
+async def generate_image(request_data: dict, request: Request, options: Optional[TranscodeOptions] = Depends(_output_options)):
+    """Handles full process: Queue Prompt → Track Progress → Get Image.
+
+    ``format``, ``quality``, ``size`` and ``thumbnail`` query parameters return a re-encoded variant.
+    """
+    client_id, priority = _requester(request)
     try:
-        # Extract workflow_data from the request
-        workflow_data = request_data.get("workflow_data")
-        if not workflow_data:
-            tutorial_path = "app/services/tutorial.json"
-            if os.path.exists(tutorial_path):
-                with open(tutorial_path, "r") as file:
-                    data = json.load(file)
-                    workflow_data = data["prompt"]
-            else:
-                raise HTTPException(status_code=400, detail="No workflow_data in request and tutorial.json not found")
-
-        # Use default server_address and generate a new client_id
-        server_address = server
-        client_id = str(uuid.uuid4())
-
-        # Pass the workflow_data directly to queue_prompt
-        queue_response = queue_prompt(server_address, client_id, workflow_data)
-        prompt_id = queue_response.get("prompt_id")
-        if not prompt_id:
-            raise HTTPException(status_code=500, detail="Failed to get prompt_id")
-
-        logger.info(f"Tracking progress for Prompt ID: ${prompt_id}")
-        track_status = track_progress(server_address, prompt_id)
-        if "error" in track_status:
-            raise HTTPException(status_code=500, detail=track_status["error"])
-
-        filename = track_status[prompt_id]["outputs"]["9"]["images"][0]["filename"]
-        image_data = get_image(server_address, filename)
-        if "error" in image_data:
-            raise HTTPException(status_code=500, detail=image_data["error"])
-        logger.info(f"Returning image with filename: ${image_data['filename']}")
-        return StreamingResponse(
-            io.BytesIO(image_data["image_data"]),
-            media_type="image/png",
-            headers={"Content-Disposition": f"attachment; filename=${image_data['filename']}"}
+        workflow_data = _load_workflow(request_data)
+
+        key = cache_key(workflow_data, "9")
+        cached = await image_cache.get(key)
+        if cached is not None and options is not None:
+            async def load_cached() -> bytes:
+                return cached
+            return await _variant_response(request, key, load_cached, options, key)
+        if cached is not None:
+            logger.info(f"Serving cached image {key}")
+            return _cached_image_response(
+                request, cached, f'"{key}"', {"Content-Disposition": f"attachment; filename={key}.png", "X-Cache": "HIT"}
+            )
+
+        result = await run_workflow(workflow_data, client_id=client_id, priority=priority)
+        image = output_images(result["outputs"], "9")[0]
+        logger.info(f"Returning image with filename: {image['filename']}")
+        if options is not None:
+            return await _view_variant(request, result["server_address"], image, options, cache_to=key)
+        return await _stream_image(
+            request,
+            result["server_address"],
+            image["filename"],
+            image.get("subfolder", ""),
+            image.get("type", "output"),
+            cache_to=key
         )
+    except HTTPException:
+        raise
+    except (NoHealthyBackendError, SchedulerTimeoutError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error in generate_image: ${str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/generate_image/batch")
+async def generate_image_batch(request_data: dict, request: Request):
+    """Generates several variants of one workflow in a single queue submission, returned as a zip.
+
+    ``mode`` "batch" raises EmptyLatentImage.batch_size so the GPU samples all variants in one
+    batch; "seeds" clones the sampler chain with consecutive seeds, sharing the upstream nodes.
+    """
+    count = request_data.get("count", 4)
+    mode = request_data.get("mode", "batch")
+    if not isinstance(count, int) or not 1 <= count <= settings.BATCH_MAX_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {settings.BATCH_MAX_VARIANTS}")
+    if mode not in ("batch", "seeds"):
+        raise HTTPException(status_code=400, detail="mode must be 'batch' or 'seeds'")
+    client_id, priority = _requester(request)
+
+    try:
+        workflow_data = _load_workflow(request_data)
+        expand = with_batch_size if mode == "batch" else with_seed_variants
+        workflow_data, output_nodes = expand(workflow_data, count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        result = await run_workflow(workflow_data, client_id=client_id, priority=priority)
+        images = [image for node_id in output_nodes for image in output_images(result["outputs"], node_id)]
+    except (NoHealthyBackendError, SchedulerTimeoutError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in generate_image_batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def relay(upstream):
+        try:
+            async for chunk in upstream.aiter_bytes():
+                yield chunk
+        finally:
+            await upstream.aclose()
+
+    async def variants():
+        for index, image in enumerate(images):
+            upstream = await comfyui_client.open_view(
+                result["server_address"], image["filename"], image.get("subfolder", ""), image.get("type", "output")
+            )
+            yield f"variant_{index + 1:02d}.png", relay(upstream)
+
+    return StreamingResponse(
+        stream_zip(variants()),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=variants.zip", "X-Variant-Count": str(len(images))}
+    )
+
+@router.get("/image_cache/{key}")
+async def get_cached_image(key: str, request: Request, options: Optional[TranscodeOptions] = Depends(_output_options)):
+    if len(key) != 64 or not all(c in "0123456789abcdef" for c in key):
+        raise HTTPException(status_code=400, detail="Invalid cache key")
+    if options is not None:
+        async def load() -> bytes:
+            data = await image_cache.get(key)
+            if data is None:
+                raise HTTPException(status_code=404, detail="Image not in cache")
+            return data
+        return await _variant_response(request, key, load, options, key)
+    etag, headers = f'"{key}"', {"Cache-Control": "public, max-age=31536000, immutable"}
+    if _etag_matches(request, etag):
+        # A key names one generated image for good, so a matching validator needs no lookup.
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    data = await image_cache.get(key)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Image not in cache")
+    return _cached_image_response(request, data, etag, headers)
+
+@router.get("/metrics")
+async def get_metrics():
+    """Stage latency histograms and error counters in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/uploads/stats")
+async def get_upload_stats():
+    """How many uploads were sent versus skipped because the backend already had the bytes."""
+    return upload_tracker.get_stats()
+
+@router.get("/transcode/stats")
+async def get_transcode_stats():
+    """Encoded variant counts, bytes before and after encoding, and the variant cache."""
+    return transcoder.get_stats()
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters and sizes of the generated image cache."""
+    return image_cache.get_stats()
+
+@router.post("/jobs/generate_image", status_code=202)
+async def submit_generate_image_job(request_data: dict, request: Request):
+    """Queues /generate_image as a background job and returns its id immediately.
+
+    Jobs are always scheduled in the batch class.
+    """
+    client_id, priority = _requester(request, "batch")
+    workflow_data = _load_workflow(request_data)
+    try:
+        job = job_manager.submit(workflow_data, output_node="9", client_id=client_id, priority=priority)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+def _get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return _get_job(job_id).to_dict()
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-sent events: progress (node, step/total_steps) and the final image URLs."""
+    job = _get_job(job_id)
+
+    async def event_stream():
+        async for event, data in job.events():
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "bmp", "tiff", "webp"}
 
 def allowed_file(filename: str) -> bool:
@@ -171,37 +571,36 @@ async def upload_image_endpoint(
         if not allowed_file(image.filename):
             raise HTTPException(status_code=400, detail="Invalid file type. Only PNG, JPG, JPEG, GIF, BMP, TIFF, and WEBP are allowed.")
 
-        files = {"image": (filename, image.file, f"image/{filename.rsplit('.', 1)[1].lower()}" if '.' in filename else "image/png")}
-        data = {
-            "type": folder_type,
-            "overwrite": overwrite.lower() == "true"
-        }
+        content_type = f"image/{filename.rsplit('.', 1)[1].lower()}" if '.' in filename else "image/png"
 
         logger.info(f"Uploading image to {server_address} with filename: ${filename}")
-        response = requests.post(
-            f"http://{server_address}/upload/{image_type}",
-            files=files,
-            data=data,
-            timeout=10
+        result = await upload_tracker.upload(
+            server_address,
+            await image.read(),
+            filename,
+            content_type=content_type,
+            folder_type=folder_type,
+            image_type=image_type,
+            keep_filename=True,
+            overwrite=overwrite.lower() == "true"
         )
-        response.raise_for_status()
-        return JSONResponse(content=response.json(), status_code=200)
-    except requests.exceptions.RequestException as e:
+        return JSONResponse(content=result, status_code=200)
+    except httpx.HTTPError as e:
         logger.error(f"Error uploading image: ${str(e)}")
-        if hasattr(e, 'response') and e.response is not None:
+        if isinstance(e, httpx.HTTPStatusError):
             logger.error(f"ComfyUI response body: ${e.response.text}")
         raise HTTPException(status_code=500, detail=f"Error uploading image: ${str(e)}")
 
 # Prompt Generator endpoints
 from fastapi import APIRouter, HTTPException, Query
-from app.services.prompt_builder import generate_prompt
+from app.services.prompt_builder import PROMPT_ENGINES, generate_prompt, prompt_flights, prompt_generator_status
+from app.services.prompt_assembly import GENERAL_FIELDS, assemble_prompts
+from app.services.campaigns import campaign_manager, parse_rows, CampaignInputError
 from app.services.prompt_templates import post_type_prompts, post_type_fields
-from app.utils.news_fetcher import fetch_google_news, fetch_trends_by_topic as fetch_topic_news
-from app.models.schemas import RequestData, NewsResponse, CaptionRequest, Article
+from app.utils.news_fetcher import NEWS_CATEGORIES, get_google_news, get_many, get_trends_by_topic as fetch_topic_news, news_cache
+from app.models.schemas import RequestData, NewsResponse, CaptionRequest, Article, TrendsBatchRequest, TrendsBatchResponse, PromptBatchRequest
 import logging
 
-GENERAL_FIELDS = ["message", "brand_name", "font", "colors"]
-
 @router.get("/")
 async def read_root():
     return {"message": "Visit /static/index.html for the frontend"}
@@ -223,28 +622,118 @@ async def get_prompt_form(post_type: str):
         "example": {field: f"example_{field}" for field in relevant_fields}
     }
 
+@router.post("/generate_prompt/batch")
+async def assemble_prompt_batch(request: PromptBatchRequest):
+    """Assembles the generator prompt of many rows at once, without calling the generator.
+
+    Rows with an unknown post_type are reported in ``errors`` by index; the rest are returned
+    in ``prompts`` in input order.
+    """
+    if len(request.rows) > settings.PROMPT_BATCH_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.PROMPT_BATCH_MAX_ROWS} rows per request.")
+
+    rows = [row.model_dump() for row in request.rows]
+    prompts, errors = [], []
+    for index, (row, prompt) in enumerate(zip(rows, assemble_prompts(rows))):
+        if prompt is None:
+            errors.append({"index": index, "detail": "Invalid post_type."})
+        else:
+            prompts.append({"index": index, "post_type": row["post_type"], "prompt": prompt})
+    return {"count": len(prompts), "prompts": prompts, "errors": errors}
+
+@router.post("/campaigns", status_code=202)
+async def create_campaign(file: UploadFile = File(...)):
+    """Starts a bulk run over a CSV or JSONL file of RequestData rows."""
+    try:
+        rows = parse_rows(await file.read(), file.filename or "")
+        campaign = await campaign_manager.create(rows)
+    except CampaignInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**campaign.to_dict(), "status_url": f"/campaigns/{campaign.id}"}
+
+@router.get("/campaigns")
+async def list_campaigns():
+    return {"campaigns": campaign_manager.list()}
+
+def _get_campaign(campaign_id: str):
+    campaign = campaign_manager.get(campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail=f"Unknown campaign {campaign_id}")
+    return campaign
+
+@router.get("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str, rows: bool = Query(False)):
+    return _get_campaign(campaign_id).to_dict(include_rows=rows)
+
+@router.get("/campaigns/{campaign_id}/images/{row}")
+async def get_campaign_image(campaign_id: str, row: int):
+    campaign = _get_campaign(campaign_id)
+    if row not in campaign.images:
+        raise HTTPException(status_code=404, detail=f"Row {row} has no image yet")
+    return FileResponse(campaign.image_path(row), media_type="image/png", headers={"ETag": f'"{campaign.images[row]}"'})
+
 @router.get("/trends", response_model=NewsResponse)
-def fetch_trends(
+async def fetch_trends(
     category: str = Query("WORLD", regex="^(WORLD|NATION|BUSINESS|TECHNOLOGY|ENTERTAINMENT|SPORTS|SCIENCE|HEALTH)$"),
     lang: str = Query("en", regex="^(en|hi|es|fr|uk|ja)$"),
     country: str = Query("WORLD", regex="^(WORLD|US|IN|GB|MX|UA|JP)$"),
     limit: int = Query(10, ge=1, le=50)
 ):
-    return fetch_google_news(category, lang, country, limit)
+    return await get_google_news(category, lang, country, limit)
 
 @router.get("/fetch_trends/{topic_name}", response_model=NewsResponse)
-def get_trends_by_topic(
+async def get_trends_by_topic(
     topic_name: str,
     lang: str = Query("en", regex="^(en|hi|es|fr|uk|ja)$"),
     country: str = Query("WORLD", regex="^(WORLD|US|IN|GB|MX|UA|JP)$"),
     limit: int = Query(10, ge=1, le=50)
 ):
     try:
-        return fetch_topic_news(topic_name, lang, country, limit)
+        return await fetch_topic_news(topic_name, lang, country, limit)
     except Exception as e:
         logger.error(f"API error for topic '{topic_name}': ${str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/trends/batch", response_model=TrendsBatchResponse)
+async def fetch_trends_batch(request: TrendsBatchRequest):
+    """Fetches several categories and topics at once, returning whatever finished in time."""
+    categories = [category.upper() for category in request.categories]
+    topics = [topic.strip() for topic in request.topics if topic.strip()]
+    invalid = [category for category in categories if category not in NEWS_CATEGORIES]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid categories: {', '.join(invalid)}")
+    if not categories and not topics:
+        raise HTTPException(status_code=400, detail="Provide at least one category or topic.")
+    if len(categories) + len(topics) > settings.NEWS_FANOUT_MAX_FEEDS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.NEWS_FANOUT_MAX_FEEDS} feeds per request.")
+    if request.lang not in ("en", "hi", "es", "fr", "uk", "ja") or request.country not in ("WORLD", "US", "IN", "GB", "MX", "UA", "JP"):
+        raise HTTPException(status_code=400, detail="Unsupported lang or country.")
+    if not 1 <= request.limit <= 50:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 50")
+
+    feeds, errors = await get_many(
+        list(dict.fromkeys(categories)), list(dict.fromkeys(topics)), request.lang, request.country, request.limit
+    )
+    return {"feeds": feeds, "errors": errors}
+
+@router.get("/prompt_generator/status")
+async def get_prompt_generator_status():
+    """Circuit breaker state, current call timeout and recent latency of the prompt generator."""
+    return prompt_generator_status()
+
+@router.get("/coalescing/stats")
+async def get_coalescing_stats():
+    """How many identical concurrent upstream calls were served by one in-flight call."""
+    return {
+        "news": {"coalesced": news_cache.get_stats()["coalesced"]},
+        "prompts": prompt_flights.get_stats(),
+        "workflows": workflow_flights.get_stats(),
+    }
+
+@router.get("/trends/cache/stats")
+async def get_news_cache_stats():
+    return news_cache.get_stats()
+
 @router.post("/generate_caption_and_hashtags")
 async def generate_caption_and_hashtags(request: CaptionRequest):
     prompt = f"""
@@ -294,103 +783,105 @@ async def connect_to_comfy_endpoint(request_data: dict):
     
 @router.post("/inpaint")
 async def inpaint(
+    request: Request,
     positive_prompt: str = Form(...),
     negative_prompt: str = Form(...),
-    prompt_file: UploadFile = File(...),
     image: UploadFile = File(...),
-    mask: UploadFile = File(...)
+    mask: UploadFile = File(...),
+    workflow: str = Form("inpaint"),
+    prompt_file: Optional[UploadFile] = File(None),
+    options: Optional[TranscodeOptions] = Depends(_output_options)
 ):
-    client_id = str(uuid.uuid4())
-    ws = websocket.WebSocket()
-
-    try:
-        # Parse inpaint.json
-        prompt_data = await prompt_file.read()
-        prompt = json.loads(prompt_data)
+    """Inpaints ``image`` under ``mask`` with a preloaded or registered workflow template.
 
-        # Upload image
-        await image.seek(0)
-        image_files = {"image": (image.filename, image.file, "image/png")}
-        img_response = requests.post(f"http://{server}/upload/image", files=image_files, data={"type": "input", "overwrite": "false"})
+    Edits of the same source image form a session that returns to the backend of the previous
+    edit, so ComfyUI only re-executes the nodes whose inputs changed; the response carries the
+    session id and how many nodes were served from cache.
 
-        if img_response.status_code != 200:
-            raise HTTPException(status_code=img_response.status_code, detail="Failed to upload image")
-
-        image_name = img_response.json().get("name")
-        print(f"Uploaded image: {image_name}")
-
-        # Upload mask
-        await mask.seek(0)
-        mask_files = {"image": (mask.filename, mask.file, "image/png")}
-        mask_response = requests.post(f"http://{server}/upload/image", files=mask_files, data={"type": "input", "overwrite": "false"})
-
-        if mask_response.status_code != 200:
-            raise HTTPException(status_code=mask_response.status_code, detail="Failed to upload mask")
-
-        mask_name = mask_response.json().get("name")
-        print(f"Uploaded mask: {mask_name}")
-
-        # Update JSON with uploaded file names
-        prompt["58"]["inputs"]["image"] = image_name
-        prompt["62"]["inputs"]["image"] = mask_name
-        prompt["51"]["inputs"]["text"] = negative_prompt
-        prompt["59"]["inputs"]["text"] = positive_prompt
-
-        print("JSON Updated")
-
-        # Connect to WebSocket
-        ws.connect(f"ws://{server}/ws?clientId={client_id}")
-
-        # Send prompt
-        response = requests.post(f"http://{server}/prompt", json={"prompt": prompt, "client_id": client_id}, headers={"Content-Type": "application/json"})
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Failed to send prompt")
-
-        response_data = response.json()
-        prompt_id = response_data.get("prompt_id")
-
-        if not prompt_id:
-            raise HTTPException(status_code=500, detail="Failed to retrieve prompt ID")
-
-        print(f"Prompt submitted successfully. Prompt ID: {prompt_id}")
-
-        # Wait for image to be ready
-        max_retries = 30
-        delay = 2
-        image_path = None
-
-        for attempt in range(max_retries):
-            print(f"Checking image status... (Attempt {attempt + 1}/{max_retries})")
-            history_response = requests.get(f"http://{server}/history/{prompt_id}")
-
-            if history_response.status_code == 200:
-                history_data = history_response.json()
-                if history_data.get(f"{prompt_id}") and "outputs" in history_data[f"{prompt_id}"]:
-                    try:
-                        image_path = history_data[f"{prompt_id}"]["outputs"]["60"]["images"][0]["filename"]
-                        print(f"Image is ready: {image_path}")
-                        break
-                    except (KeyError, IndexError):
-                        pass  # Image is not yet available
-
-            await asyncio.sleep(delay)
-        
-        if not image_path:
-            raise HTTPException(status_code=500, detail="Timed out waiting for generated image")
-
-        # Fetch the final image
-        img_response = requests.get(f"http://{server}/view?filename={image_path}&subfolder=&type=output", stream=True)
+    ``prompt_file`` is still accepted from older clients and is treated as a one-off template
+    with the bundled inpaint node ids.
+    """
+    try:
+        if prompt_file is not None:
+            try:
+                template = WorkflowTemplate("upload", json.loads(await prompt_file.read()), INPAINT_ROLES, "60", builtin=False)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid workflow file: {str(e)}")
+        else:
+            try:
+                template = workflow_registry.get(workflow)
+            except KeyError:
+                raise HTTPException(status_code=404, detail=f"Unknown workflow '{workflow}'")
+        if not template.has_roles(*INPAINT_REQUIRED_ROLES):
+            raise HTTPException(
+                status_code=400, detail=f"Workflow '{template.name}' needs roles: {', '.join(INPAINT_REQUIRED_ROLES)}"
+            )
+
+        client_id, priority = _requester(request)
+        session = edit_sessions.open(template.name, await image.read())
+        prefer = edit_sessions.placement(session, [backend.address for backend in backend_pool.backends if backend.healthy])
+        # Uploads and the prompt must land on the same backend, so hold one slot for both.
+        async with scheduler.slot(client_id, priority, template.models, prefer=prefer) as backend:
+            return await _run_inpaint(
+                request, backend, template, positive_prompt, negative_prompt, image, mask, options, session
+            )
+
+    except HTTPException:
+        raise
+
+    except (NoHealthyBackendError, SchedulerTimeoutError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if img_response.status_code != 200:
-            raise HTTPException(status_code=img_response.status_code, detail="Failed to fetch generated image")
+async def _run_inpaint(request: Request, backend, template: WorkflowTemplate, positive_prompt: str, negative_prompt: str, image: UploadFile, mask: UploadFile, options: Optional[TranscodeOptions] = None, session: Optional[EditSession] = None):
+    """Uploads the image and mask, runs the inpaint workflow and returns the result on one backend."""
+    server = backend.address
+
+    # Upload image and mask concurrently; content the backend already has is not re-sent
+    async def upload(file: UploadFile, label: str) -> str:
+        await file.seek(0)
+        try:
+            result = await upload_tracker.upload(server, await file.read(), file.filename)
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=f"Failed to upload {label}")
+        return result.get("name")
+
+    image_name, mask_name = await asyncio.gather(upload(image, "image"), upload(mask, "mask"))
+    logger.info(f"Uploaded image: {image_name}")
+    logger.info(f"Uploaded mask: {mask_name}")
+
+    prompt = template.render(
+        image=image_name, mask=mask_name, positive_text=positive_prompt, negative_text=negative_prompt
+    )
+
+    # Send prompt and wait for the completion event
+    cached = CachedNodeCollector()
+    try:
+        result = await run_workflow(prompt, on_event=cached, backend=backend)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail="Failed to send prompt")
+    logger.info(f"Prompt {result['prompt_id']} finished")
+    cached.add_history(result["status"])
+    nodes_cached = len(cached.nodes & set(prompt))
+    headers = {"X-Nodes-Cached": f"{nodes_cached}/{len(prompt)}"}
+    if session is not None:
+        session.record(server, len(prompt), nodes_cached)
+        headers["X-Edit-Session"] = session.id
 
-        # Return the image
-        return StreamingResponse(img_response.raw, media_type="image/png")
+    try:
+        output = output_images(result["outputs"], template.output_node)[0]
+    except ComfyUIExecutionError:
+        raise HTTPException(status_code=500, detail="Generated image missing from ComfyUI outputs")
+    logger.info(f"Image is ready: {output['filename']}")
 
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid JSON file")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        ws.close()
\ No newline at end of file
+    # Stream the final image back
+    try:
+        if options is not None:
+            response = await _view_variant(request, server, output, options)
+        else:
+            response = await _stream_image(request, server, output["filename"], output.get("subfolder", ""), output.get("type", "output"))
+        response.headers.update(headers)
+        return response
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail="Failed to fetch generated image")
\ No newline at end of file
@@ -1,6 +1,121 @@
 # Configuration settings
+import os
+
+
 class Settings:
-    SERVER_ADDRESS = "independently-penetration-dice-failed.trycloudflare.com"
+    SERVER_ADDRESS = os.getenv("COMFYUI_SERVER_ADDRESS", "damage-romantic-environmental-rome.trycloudflare.com")
+
+    # Comma-separated pool of ComfyUI backends; defaults to SERVER_ADDRESS alone.
+    COMFYUI_BACKENDS = [a.strip() for a in os.getenv("COMFYUI_BACKENDS", SERVER_ADDRESS).split(",") if a.strip()]
+    COMFYUI_HEALTH_INTERVAL = float(os.getenv("COMFYUI_HEALTH_INTERVAL", "5"))
+    COMFYUI_HEALTH_TIMEOUT = float(os.getenv("COMFYUI_HEALTH_TIMEOUT", "3"))
+    COMFYUI_HEALTH_FAILURES = int(os.getenv("COMFYUI_HEALTH_FAILURES", "2"))
+    COMFYUI_QUEUE_DEPTH_TTL = float(os.getenv("COMFYUI_QUEUE_DEPTH_TTL", "1"))
+
+    # ComfyUI HTTP client
+    COMFYUI_CONNECT_TIMEOUT = float(os.getenv("COMFYUI_CONNECT_TIMEOUT", "5"))
+    COMFYUI_READ_TIMEOUT = float(os.getenv("COMFYUI_READ_TIMEOUT", "30"))
+    COMFYUI_MAX_RETRIES = int(os.getenv("COMFYUI_MAX_RETRIES", "2"))
+    COMFYUI_RETRY_BACKOFF = float(os.getenv("COMFYUI_RETRY_BACKOFF", "0.5"))
+    COMFYUI_MAX_CONNECTIONS = int(os.getenv("COMFYUI_MAX_CONNECTIONS", "100"))
+    COMFYUI_MAX_KEEPALIVE = int(os.getenv("COMFYUI_MAX_KEEPALIVE", "20"))
+
+    # ComfyUI /ws event stream
+    COMFYUI_WS_RECONNECT_DELAY = float(os.getenv("COMFYUI_WS_RECONNECT_DELAY", "1"))
+    COMFYUI_HISTORY_FALLBACK_INTERVAL = float(os.getenv("COMFYUI_HISTORY_FALLBACK_INTERVAL", "10"))
+    COMFYUI_JOB_TIMEOUT = float(os.getenv("COMFYUI_JOB_TIMEOUT", "600"))
+
+    # Background generation jobs
+    JOB_MAX_CONCURRENCY = int(os.getenv("JOB_MAX_CONCURRENCY", "8"))
+    JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "256"))
+    JOB_MAX_RETAINED = int(os.getenv("JOB_MAX_RETAINED", "1000"))
+    JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+    BATCH_MAX_VARIANTS = int(os.getenv("BATCH_MAX_VARIANTS", "8"))
+    WORKFLOW_MAX_CUSTOM = int(os.getenv("WORKFLOW_MAX_CUSTOM", "100"))
+
+    # Scheduler in front of ComfyUI: jobs handed to each backend at once, running jobs per
+    # client, optional "client=weight" shares and how long a request may wait for a slot.
+    SCHEDULER_BACKEND_SLOTS = int(os.getenv("SCHEDULER_BACKEND_SLOTS", "2"))
+    SCHEDULER_CLIENT_QUOTA = int(os.getenv("SCHEDULER_CLIENT_QUOTA", "4"))
+    SCHEDULER_CLIENT_WEIGHTS = {
+        name.strip(): float(weight)
+        for name, _, weight in (item.partition("=") for item in os.getenv("SCHEDULER_CLIENT_WEIGHTS", "").split(","))
+        if name.strip() and weight.strip()
+    }
+    SCHEDULER_QUEUE_TIMEOUT = float(os.getenv("SCHEDULER_QUEUE_TIMEOUT", "300"))
+    # Model files remembered as loaded per backend, and how far (in fair-share units) a job
+    # whose models are warm on a free backend may overtake the job that is due next.
+    SCHEDULER_WARM_MODELS = int(os.getenv("SCHEDULER_WARM_MODELS", "2"))
+    SCHEDULER_AFFINITY_SLACK = float(os.getenv("SCHEDULER_AFFINITY_SLACK", "4"))
+
+    # Inpaint edit sessions: repeated edits of one source image return to the same backend.
+    INPAINT_SESSION_TTL = float(os.getenv("INPAINT_SESSION_TTL", "1800"))
+    INPAINT_SESSION_MAX = int(os.getenv("INPAINT_SESSION_MAX", "1000"))
+
+    # Upload deduplication
+    UPLOAD_DEDUP_MAX_ENTRIES = int(os.getenv("UPLOAD_DEDUP_MAX_ENTRIES", "4096"))
+    UPLOAD_DEDUP_TTL = float(os.getenv("UPLOAD_DEDUP_TTL", "21600"))
+
+    # Generated image cache
+    IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "cache/images")
+    IMAGE_CACHE_MEMORY_BYTES = int(os.getenv("IMAGE_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+    IMAGE_CACHE_DISK_BYTES = int(os.getenv("IMAGE_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+
+    # Output transcoding (WebP/JPEG variants and thumbnails)
+    TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "2"))
+    TRANSCODE_QUALITY = int(os.getenv("TRANSCODE_QUALITY", "80"))
+    TRANSCODE_MAX_SIZE = int(os.getenv("TRANSCODE_MAX_SIZE", "4096"))
+    THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+    TRANSCODE_CACHE_DIR = os.getenv("TRANSCODE_CACHE_DIR", "cache/variants")
+    TRANSCODE_CACHE_MEMORY_BYTES = int(os.getenv("TRANSCODE_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+    TRANSCODE_CACHE_DISK_BYTES = int(os.getenv("TRANSCODE_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+    # Hugging Face prompt generator
+    PROMPT_GENERATOR_SPACE = os.getenv("PROMPT_GENERATOR_SPACE", "atharva-dev/prompt_generator")
+    PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "1024"))
+    PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", "3600"))
+    PROMPT_BATCH_MAX_ROWS = int(os.getenv("PROMPT_BATCH_MAX_ROWS", "10000"))
+    # The breaker opens after PROMPT_BREAKER_FAILURES failed calls in a row and lets one probe
+    # through every PROMPT_BREAKER_RESET seconds. Each call times out after PROMPT_TIMEOUT_FACTOR
+    # x the recent p99 (clamped to MIN..MAX); retries included, a prompt gives up after
+    # PROMPT_DEADLINE seconds. Until there is latency history (startup) both are
+    # PROMPT_TIMEOUT_COLD instead. PROMPT_HEDGE fires a second call once the first passes the p95.
+    PROMPT_BREAKER_FAILURES = int(os.getenv("PROMPT_BREAKER_FAILURES", "3"))
+    PROMPT_BREAKER_RESET = float(os.getenv("PROMPT_BREAKER_RESET", "30"))
+    PROMPT_TIMEOUT_MIN = float(os.getenv("PROMPT_TIMEOUT_MIN", "2"))
+    PROMPT_TIMEOUT_MAX = float(os.getenv("PROMPT_TIMEOUT_MAX", "15"))
+    PROMPT_TIMEOUT_FACTOR = float(os.getenv("PROMPT_TIMEOUT_FACTOR", "2"))
+    PROMPT_TIMEOUT_COLD = float(os.getenv("PROMPT_TIMEOUT_COLD", "8"))
+    PROMPT_DEADLINE = float(os.getenv("PROMPT_DEADLINE", "20"))
+    PROMPT_RETRIES = int(os.getenv("PROMPT_RETRIES", "3"))
+    PROMPT_RETRY_BACKOFF = float(os.getenv("PROMPT_RETRY_BACKOFF", "0.5"))
+    PROMPT_LATENCY_WINDOW = int(os.getenv("PROMPT_LATENCY_WINDOW", "200"))
+    PROMPT_HEDGE = os.getenv("PROMPT_HEDGE", "false").lower() in ("1", "true", "yes")
+    PROMPT_GENERATOR_THREADS = int(os.getenv("PROMPT_GENERATOR_THREADS", "16"))
+    # "remote" always asks the Space, "local" uses the offline engine, and "auto" asks the Space
+    # unless its breaker is open or its recent p95 exceeds the latency budget (seconds, 0 = none).
+    # Whenever the Space gives no answer, the local engine's expansion is used.
+    PROMPT_ENGINE = os.getenv("PROMPT_ENGINE", "auto")
+    PROMPT_LATENCY_BUDGET = float(os.getenv("PROMPT_LATENCY_BUDGET", "0"))
+
+    # Google News trend cache
+    NEWS_CACHE_TTL = float(os.getenv("NEWS_CACHE_TTL", "300"))
+    NEWS_CACHE_STALE_TTL = float(os.getenv("NEWS_CACHE_STALE_TTL", "3600"))
+    NEWS_CACHE_SIZE = int(os.getenv("NEWS_CACHE_SIZE", "256"))
+    NEWS_FANOUT_CONCURRENCY = int(os.getenv("NEWS_FANOUT_CONCURRENCY", "4"))
+    NEWS_FANOUT_MAX_FEEDS = int(os.getenv("NEWS_FANOUT_MAX_FEEDS", "16"))
+    NEWS_FEED_TIMEOUT = float(os.getenv("NEWS_FEED_TIMEOUT", "8"))
+
+    # Bulk campaigns: checkpoint directory and per-stage concurrency
+    CAMPAIGN_DIR = os.getenv("CAMPAIGN_DIR", "cache/campaigns")
+    CAMPAIGN_MAX_ROWS = int(os.getenv("CAMPAIGN_MAX_ROWS", "5000"))
+    CAMPAIGN_PROMPT_CONCURRENCY = int(os.getenv("CAMPAIGN_PROMPT_CONCURRENCY", "4"))
+    CAMPAIGN_GENERATE_CONCURRENCY = int(os.getenv("CAMPAIGN_GENERATE_CONCURRENCY", "4"))
+    CAMPAIGN_FETCH_CONCURRENCY = int(os.getenv("CAMPAIGN_FETCH_CONCURRENCY", "8"))
+    # Rows hit by an outage (no backend, queue timeout, connection errors) are retried with
+    # exponential backoff, then left pending for the next resume instead of marked failed.
+    CAMPAIGN_ROW_RETRIES = int(os.getenv("CAMPAIGN_ROW_RETRIES", "5"))
+    CAMPAIGN_RETRY_BACKOFF = float(os.getenv("CAMPAIGN_RETRY_BACKOFF", "2"))
 
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
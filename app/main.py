@@ -3,15 +3,34 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from app.utils.static_files import PrecompressedStaticFiles
 from app.api.routes import router as api_router
+from app.services.comfyui import comfyui_client
+from app.services.comfyui_events import stop_listeners
+from app.services.backend_pool import backend_pool
+from app.services.jobs import job_manager
+from app.services.campaigns import campaign_manager
+from app.services.transcode import transcoder
+from contextlib import asynccontextmanager
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="ComfyUI Integration API", description="API for integrating with ComfyUI")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    backend_pool.start()
+    await campaign_manager.resume()
+    yield
+    await campaign_manager.shutdown()
+    await job_manager.shutdown()
+    await backend_pool.stop()
+    await stop_listeners()
+    await comfyui_client.aclose()
+    transcoder.shutdown()
+
+app = FastAPI(title="ComfyUI Integration API", description="API for integrating with ComfyUI", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -26,7 +45,7 @@ app.add_middleware(
 app.include_router(router)
 
 
-app.mount("/static", StaticFiles(directory="app/static"), name="static") #app/static
+app.mount("/static", PrecompressedStaticFiles(directory="app/static"), name="static") #app/static
 
 app.include_router(api_router)
 
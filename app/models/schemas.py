@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Dict, List, Any, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Any, Literal, Optional
 
 class PromptNode(BaseModel):
     inputs: Dict[str, Any]  # Allow any input structure
@@ -11,6 +11,12 @@ class ComfyUIPrompt(BaseModel):
     client_id: str
     server_address: str
 
+class WorkflowRegistration(BaseModel):
+    name: Optional[str] = Field(None, pattern="^[A-Za-z0-9_.-]{1,64}$")
+    workflow: Dict[str, Any]
+    roles: Dict[str, List[str]]
+    output_node: str
+
 class HistoryResponse(BaseModel):
     all_prompts: Dict[str, Dict]
 
@@ -46,6 +52,11 @@ class RequestData(BaseModel):
     tags: Optional[List[str]] = None
     keywords: Optional[List[str]] = None
     overlay_text: Optional[Dict[str, str]] = None
+    prompt_engine: Optional[Literal["remote", "local", "auto"]] = None
+    latency_budget: Optional[float] = Field(None, gt=0)
+
+class PromptBatchRequest(BaseModel):
+    rows: List[RequestData]
 
 class Article(BaseModel):
     title: str
@@ -57,6 +68,17 @@ class NewsResponse(BaseModel):
     feed_title: str
     articles: List[Article]
 
+class TrendsBatchRequest(BaseModel):
+    categories: List[str] = []
+    topics: List[str] = []
+    lang: str = "en"
+    country: str = "WORLD"
+    limit: int = 10
+
+class TrendsBatchResponse(BaseModel):
+    feeds: Dict[str, NewsResponse]
+    errors: Dict[str, str]
+
 class CaptionRequest(BaseModel):
     positive_prompt: str
     negative_prompt: str
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.comfyui import ComfyUIClient, comfyui_client
+from app.services.comfyui_events import ComfyUIEventListener, get_listener
+from app.services.uploads import upload_tracker
+
+logger = logging.getLogger(__name__)
+
+
+class NoHealthyBackendError(Exception):
+    """Raised when every configured ComfyUI backend is ejected."""
+
+
+class ComfyUIBackend:
+    """A single ComfyUI server and what we currently know about its load and health."""
+
+    def __init__(self, address: str):
+        self.address = address
+        self.healthy = True
+        self.queue_depth = 0
+        self.inflight = 0
+        self.consecutive_failures = 0
+        self.last_checked = 0.0
+        # Model files of the jobs most recently handed to this backend, newest first.
+        self.warm_models: List[str] = []
+
+    @property
+    def listener(self) -> ComfyUIEventListener:
+        return get_listener(self.address)
+
+    @property
+    def load(self) -> int:
+        # Jobs we submitted since the last /queue probe are not visible in queue_depth yet.
+        return max(self.queue_depth, self.inflight)
+
+    def is_warm(self, models) -> bool:
+        return bool(models) and all(model in self.warm_models for model in models)
+
+    def mark_warm(self, models, capacity: int):
+        """Records that ``models`` are about to be loaded here, evicting the oldest beyond ``capacity``."""
+        if models:
+            self.warm_models = (list(models) + [model for model in self.warm_models if model not in models])[:capacity]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "address": self.address,
+            "healthy": self.healthy,
+            "queue_depth": self.queue_depth,
+            "inflight": self.inflight,
+            "consecutive_failures": self.consecutive_failures,
+            "warm_models": self.warm_models,
+        }
+
+
+class BackendPool:
+    """Routes each job to the healthy ComfyUI backend with the shortest queue.
+
+    A background loop probes every backend's /queue endpoint, which doubles as the health
+    check: backends are ejected after repeated failures and restored on the first success.
+    """
+
+    def __init__(
+        self,
+        addresses: List[str],
+        client: ComfyUIClient = comfyui_client,
+        health_interval: float = settings.COMFYUI_HEALTH_INTERVAL,
+        failure_threshold: int = settings.COMFYUI_HEALTH_FAILURES,
+        depth_ttl: float = settings.COMFYUI_QUEUE_DEPTH_TTL,
+    ):
+        if not addresses:
+            raise ValueError("At least one ComfyUI backend address is required")
+        self.backends = [ComfyUIBackend(address) for address in addresses]
+        self.client = client
+        self.health_interval = health_interval
+        self.failure_threshold = failure_threshold
+        self.depth_ttl = depth_ttl
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, address: str) -> Optional[ComfyUIBackend]:
+        for backend in self.backends:
+            if backend.address == address:
+                return backend
+        return None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._health_loop(), name="comfyui-health")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _health_loop(self):
+        while True:
+            await self.refresh(self.backends)
+            await asyncio.sleep(self.health_interval)
+
+    async def refresh(self, backends: List[ComfyUIBackend]):
+        await asyncio.gather(*(self._probe(backend) for backend in backends))
+
+    async def _probe(self, backend: ComfyUIBackend):
+        try:
+            response = await self.client.request(
+                "GET", backend.address, "/queue", timeout=settings.COMFYUI_HEALTH_TIMEOUT, retries=0
+            )
+            queue = response.json()
+        except Exception as e:
+            self.record_failure(backend, e)
+            return
+        backend.queue_depth = len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+        backend.last_checked = time.monotonic()
+        backend.consecutive_failures = 0
+        if not backend.healthy:
+            logger.info(f"ComfyUI backend {backend.address} recovered; returning it to the pool")
+            backend.healthy = True
+            # It may have been restarted with a fresh input folder and nothing loaded.
+            upload_tracker.forget(backend.address)
+            backend.warm_models = []
+        # Keep the event stream warm so the first job on this backend does not miss events.
+        get_listener(backend.address)
+
+    def record_failure(self, backend: ComfyUIBackend, error: Exception):
+        backend.consecutive_failures += 1
+        if backend.healthy and backend.consecutive_failures >= self.failure_threshold:
+            logger.warning(f"Ejecting ComfyUI backend {backend.address} after {backend.consecutive_failures} failures: {str(error)}")
+            backend.healthy = False
+
+    async def acquire(self) -> ComfyUIBackend:
+        """Picks the healthy backend with the least queued work."""
+        healthy = [backend for backend in self.backends if backend.healthy]
+        if not healthy:
+            raise NoHealthyBackendError("No healthy ComfyUI backend available")
+        if len(healthy) > 1:
+            now = time.monotonic()
+            stale = [backend for backend in healthy if now - backend.last_checked > self.depth_ttl]
+            if stale:
+                await self.refresh(stale)
+                healthy = [backend for backend in healthy if backend.healthy] or healthy
+        return min(self.preferred(healthy), key=lambda backend: backend.load)
+
+    @staticmethod
+    def preferred(backends: List[ComfyUIBackend]) -> List[ComfyUIBackend]:
+        """Drops backends whose last probe failed, unless nothing else is left."""
+        return [backend for backend in backends if backend.consecutive_failures == 0] or backends
+
+    @asynccontextmanager
+    async def lease(self, backend: Optional[ComfyUIBackend] = None):
+        """Holds a backend for the duration of one job, counting it as in flight."""
+        backend = backend or await self.acquire()
+        backend.inflight += 1
+        try:
+            yield backend
+        except httpx.TransportError as e:
+            self.record_failure(backend, e)
+            raise
+        finally:
+            backend.inflight -= 1
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [backend.to_dict() for backend in self.backends]
+
+
+backend_pool = BackendPool(settings.COMFYUI_BACKENDS)
@@ -0,0 +1,370 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+import httpx
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.models.schemas import RequestData
+from app.services.backend_pool import NoHealthyBackendError
+from app.services.comfyui import comfyui_client
+from app.services.generation import run_workflow, output_images
+from app.services.image_cache import cache_key, image_cache
+from app.services.prompt_builder import expand_request
+from app.services.prompt_templates import post_type_prompts
+from app.services.scheduler import SchedulerTimeoutError
+from app.services.workflows import workflow_registry
+
+logger = logging.getLogger(__name__)
+
+LIST_FIELDS = ("tags", "keywords")
+DICT_FIELDS = ("overlay_text",)
+
+
+class CampaignInputError(ValueError):
+    """Raised when an uploaded campaign file cannot be parsed."""
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a row failed because of an outage rather than because of the row itself."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (NoHealthyBackendError, SchedulerTimeoutError, httpx.TransportError, asyncio.TimeoutError))
+
+
+def parse_rows(content: bytes, filename: str = "") -> List[Dict[str, Any]]:
+    """Parses a CSV or JSONL upload into raw row dicts.
+
+    JSONL is detected by extension or by the first non-blank character being ``{``. In CSV,
+    list fields are comma-separated and dict fields hold a JSON object.
+    """
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise CampaignInputError("Campaign file must be UTF-8 encoded")
+
+    if filename.lower().endswith((".jsonl", ".ndjson")) or text.lstrip().startswith("{"):
+        rows = []
+        for number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CampaignInputError(f"Line {number} is not valid JSON: {str(e)}")
+            if not isinstance(row, dict):
+                raise CampaignInputError(f"Line {number} is not a JSON object")
+            rows.append(row)
+        return rows
+
+    rows = []
+    for row in csv.DictReader(io.StringIO(text)):
+        parsed = {}
+        for key, value in row.items():
+            if key is None or value is None or not value.strip():
+                continue
+            key, value = key.strip(), value.strip()
+            if key in LIST_FIELDS:
+                value = [item.strip() for item in value.split(",") if item.strip()]
+            elif key in DICT_FIELDS:
+                try:
+                    value = json.loads(value)
+                except json.JSONDecodeError:
+                    raise CampaignInputError(f"Column {key} must hold a JSON object")
+            parsed[key] = value
+        rows.append(parsed)
+    return rows
+
+
+class Campaign:
+    """A bulk generation run whose progress is checkpointed to ``directory``.
+
+    ``manifest.json`` holds the input rows; ``progress.jsonl`` is an append-only log of
+    finished stages (prompt, image, failed) that is replayed on restart. Only permanent failures
+    are logged; a row that kept hitting an outage stays pending, with the error kept in
+    ``deferred`` until the campaign is resumed.
+    """
+
+    def __init__(self, campaign_id: str, directory: str, rows: List[Dict[str, Any]], created_at: float):
+        self.id = campaign_id
+        self.directory = directory
+        self.rows = rows
+        self.created_at = created_at
+        self.status = "queued"
+        self.prompts: Dict[int, Dict[str, str]] = {}
+        self.images: Dict[int, str] = {}
+        self.errors: Dict[int, str] = {}
+        self.deferred: Dict[int, str] = {}
+        self._unwritten: List[Dict[str, Any]] = []
+        self._write_lock = asyncio.Lock()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    @property
+    def progress_path(self) -> str:
+        return os.path.join(self.directory, "progress.jsonl")
+
+    def image_path(self, index: int) -> str:
+        return os.path.join(self.directory, "images", f"{index:06d}.png")
+
+    def pending_rows(self) -> List[int]:
+        return [index for index in range(len(self.rows)) if index not in self.images and index not in self.errors]
+
+    def save_manifest(self):
+        os.makedirs(os.path.join(self.directory, "images"), exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"id": self.id, "created_at": self.created_at, "rows": self.rows}, file)
+        os.replace(tmp_path, self.manifest_path)
+
+    async def checkpoint(self, record: Dict[str, Any]):
+        """Applies one finished stage and returns once it is in the progress log.
+
+        Writes run on a thread, one at a time; records that arrive while a write is in progress
+        go out together in the next one.
+        """
+        self.apply(record)
+        self._unwritten.append(record)
+        async with self._write_lock:
+            if self._unwritten:
+                records, self._unwritten = self._unwritten, []
+                await asyncio.to_thread(self._append, records)
+
+    def _append(self, records: List[Dict[str, Any]]):
+        with open(self.progress_path, "a", encoding="utf-8") as file:
+            file.write("".join(json.dumps(record) + "\n" for record in records))
+            file.flush()
+
+    def finished_status(self) -> str:
+        """Terminal status once no row is being worked on: completed, partial or failed."""
+        if len(self.images) == len(self.rows):
+            return "completed"
+        return "partial" if self.images else "failed"
+
+    def apply(self, record: Dict[str, Any]):
+        index = record["row"]
+        if record["stage"] == "prompt":
+            self.prompts[index] = {"positive": record["positive"], "negative": record["negative"]}
+        elif record["stage"] == "image":
+            self.images[index] = record["cache_key"]
+        elif record["stage"] == "failed":
+            self.errors[index] = record["error"]
+
+    @classmethod
+    def load(cls, directory: str) -> "Campaign":
+        with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        campaign = cls(manifest["id"], directory, manifest["rows"], manifest["created_at"])
+        if os.path.exists(campaign.progress_path):
+            with open(campaign.progress_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        campaign.apply(json.loads(line))
+                    except (json.JSONDecodeError, KeyError):
+                        # A torn last line from a crash; that stage simply runs again.
+                        continue
+        if not campaign.pending_rows():
+            campaign.status = campaign.finished_status()
+        return campaign
+
+    def to_dict(self, include_rows: bool = False) -> Dict[str, Any]:
+        result = {
+            "campaign_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "total": len(self.rows),
+            "prompted": len(self.prompts),
+            "completed": len(self.images),
+            "failed": len(self.errors),
+            "deferred": len(self.deferred),
+        }
+        if include_rows:
+            result["rows"] = [self.row_dict(index) for index in range(len(self.rows))]
+        return result
+
+    def row_dict(self, index: int) -> Dict[str, Any]:
+        if index in self.images:
+            return {"row": index, "status": "completed", "image_url": f"/campaigns/{self.id}/images/{index}"}
+        if index in self.errors:
+            return {"row": index, "status": "failed", "error": self.errors[index]}
+        row = {"row": index, "status": "prompted" if index in self.prompts else "pending"}
+        if index in self.deferred:
+            row["error"] = self.deferred[index]
+        return row
+
+
+class CampaignManager:
+    """Runs campaigns row by row through prompt generation, ComfyUI and image download.
+
+    Each stage has its own concurrency limit, so a slow prompt generator does not leave
+    ComfyUI idle and vice versa. Every finished stage is checkpointed, and ``resume`` picks
+    unfinished campaigns back up after a restart without redoing finished rows.
+    """
+
+    def __init__(
+        self,
+        directory: str = settings.CAMPAIGN_DIR,
+        prompt_concurrency: int = settings.CAMPAIGN_PROMPT_CONCURRENCY,
+        generate_concurrency: int = settings.CAMPAIGN_GENERATE_CONCURRENCY,
+        fetch_concurrency: int = settings.CAMPAIGN_FETCH_CONCURRENCY,
+        row_retries: int = settings.CAMPAIGN_ROW_RETRIES,
+        retry_backoff: float = settings.CAMPAIGN_RETRY_BACKOFF,
+    ):
+        self.directory = directory
+        self.prompt_concurrency = prompt_concurrency
+        self.generate_concurrency = generate_concurrency
+        self.fetch_concurrency = fetch_concurrency
+        self.row_retries = row_retries
+        self.retry_backoff = retry_backoff
+        self._campaigns: "OrderedDict[str, Campaign]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def validate_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Normalises rows through ``RequestData``; raises ``CampaignInputError`` on bad input."""
+        if not rows:
+            raise CampaignInputError("Campaign file has no rows")
+        if len(rows) > settings.CAMPAIGN_MAX_ROWS:
+            raise CampaignInputError(f"At most {settings.CAMPAIGN_MAX_ROWS} rows per campaign")
+        validated = []
+        for index, row in enumerate(rows):
+            try:
+                data = RequestData(**row).model_dump(exclude_none=True)
+            except ValidationError as e:
+                raise CampaignInputError(f"Row {index}: {str(e)}")
+            if (data.get("post_type") or "").strip().lower() not in post_type_prompts:
+                raise CampaignInputError(f"Row {index}: invalid post_type")
+            validated.append(data)
+        return validated
+
+    async def create(self, rows: List[Dict[str, Any]]) -> Campaign:
+        rows = self.validate_rows(rows)
+        campaign_id = str(uuid.uuid4())
+        campaign = Campaign(campaign_id, os.path.join(self.directory, campaign_id), rows, time.time())
+        await asyncio.to_thread(campaign.save_manifest)
+        self._start(campaign)
+        return campaign
+
+    def get(self, campaign_id: str) -> Optional[Campaign]:
+        return self._campaigns.get(campaign_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [campaign.to_dict() for campaign in self._campaigns.values()]
+
+    async def resume(self):
+        """Loads every checkpointed campaign and restarts the unfinished ones."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in sorted(await asyncio.to_thread(os.listdir, self.directory)):
+            directory = os.path.join(self.directory, name)
+            if name in self._campaigns or not os.path.exists(os.path.join(directory, "manifest.json")):
+                continue
+            try:
+                campaign = await asyncio.to_thread(Campaign.load, directory)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Could not load campaign {name}: {str(e)}")
+                continue
+            if campaign.status != "queued":
+                self._campaigns[campaign.id] = campaign
+            else:
+                logger.info(f"Resuming campaign {campaign.id}: {len(campaign.pending_rows())} rows left")
+                self._start(campaign)
+
+    def _start(self, campaign: Campaign):
+        self._campaigns[campaign.id] = campaign
+        task = asyncio.create_task(self._run(campaign))
+        self._tasks[campaign.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(campaign.id, None))
+
+    async def _run(self, campaign: Campaign):
+        campaign.status = "running"
+        stages = {
+            "prompt": asyncio.Semaphore(self.prompt_concurrency),
+            "generate": asyncio.Semaphore(self.generate_concurrency),
+            "fetch": asyncio.Semaphore(self.fetch_concurrency),
+        }
+        # Bounds how many rows are between stages, so huge campaigns are streamed, not fanned out.
+        window = asyncio.Semaphore(2 * (self.prompt_concurrency + self.generate_concurrency + self.fetch_concurrency))
+
+        async def run_row(index: int):
+            try:
+                for attempt in range(self.row_retries + 1):
+                    try:
+                        await self._run_row(campaign, index, stages)
+                    except Exception as e:
+                        if not is_transient(e):
+                            logger.error(f"Campaign {campaign.id} row {index} failed: {str(e)}")
+                            await campaign.checkpoint({"row": index, "stage": "failed", "error": str(e)})
+                            return
+                        campaign.deferred[index] = str(e)
+                        if attempt == self.row_retries:
+                            logger.warning(f"Campaign {campaign.id} row {index} left pending after {attempt + 1} attempts: {str(e)}")
+                            return
+                        await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+                    else:
+                        campaign.deferred.pop(index, None)
+                        return
+            finally:
+                window.release()
+
+        tasks = []
+        for index in campaign.pending_rows():
+            await window.acquire()
+            tasks.append(asyncio.create_task(run_row(index)))
+        await asyncio.gather(*tasks)
+        campaign.status = campaign.finished_status()
+        logger.info(
+            f"Campaign {campaign.id} {campaign.status}: {len(campaign.images)} images, {len(campaign.errors)} failed, "
+            f"{len(campaign.deferred)} left pending"
+        )
+
+    async def _run_row(self, campaign: Campaign, index: int, stages: Dict[str, asyncio.Semaphore]):
+        prompt = campaign.prompts.get(index)
+        if prompt is None:
+            async with stages["prompt"]:
+                row = campaign.rows[index]
+                positive, negative, _ = await expand_request(row, row.get("prompt_engine"), row.get("latency_budget"))
+            prompt = {"positive": positive, "negative": negative}
+            await campaign.checkpoint({"row": index, "stage": "prompt", **prompt})
+
+        template = workflow_registry.get("tutorial")
+        workflow = template.render(positive_text=prompt["positive"], negative_text=prompt["negative"])
+        key = cache_key(workflow, template.output_node)
+        data = await image_cache.get(key)
+        if data is None:
+            async with stages["generate"]:
+                result = await run_workflow(workflow, client_id=f"campaign:{campaign.id}", priority="batch")
+            image = output_images(result["outputs"], template.output_node)[0]
+            async with stages["fetch"]:
+                data = await comfyui_client.view(
+                    result["server_address"], image["filename"], image.get("subfolder", ""), image.get("type", "output")
+                )
+            await image_cache.put(key, data)
+
+        await asyncio.to_thread(self._write_image, campaign.image_path(index), data)
+        await campaign.checkpoint({"row": index, "stage": "image", "cache_key": key})
+
+    @staticmethod
+    def _write_image(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    async def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+campaign_manager = CampaignManager()
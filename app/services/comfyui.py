@@ -1,71 +1,160 @@
-import requests
-import io
-import time
-import json
+import asyncio
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import track
 from app.models.schemas import ComfyUIPrompt, HistoryResponse, ProgressResponse
 
 logger = logging.getLogger(__name__)
 
-def queue_prompt(server_address: str, client_id: str, prompt: Dict) -> Dict[str, Any]:
-    """Sends a workflow JSON prompt to ComfyUI."""
-    try:
-        payload = {"prompt": prompt, "client_id": client_id}
-        logger.info(f"Sending prompt to ComfyUI: {json.dumps(payload, indent=2)}")
-        response = requests.post(
-            f"http://{server_address}/prompt",
-            json=payload,
-            headers={"Content-Type": "application/json"},
-        )
-        response.raise_for_status()
-        result = response.json()
-        logger.info(f"ComfyUI response: {json.dumps(result, indent=2)}")
-        return result
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error queuing prompt: {str(e)}")
-        return {"error": str(e)}
-    except Exception as e:
-        logger.error(f"Unexpected error in queue_prompt: {str(e)}")
-        return {"error": str(e)}
-
-def track_progress(server_address: str, prompt_id: str) -> Dict[str, Any]:
-    """Tracks progress of an ongoing prompt until completion."""
-    try:
-        counter = 1
+# Status codes worth retrying: the tunnel or ComfyUI itself is briefly unavailable.
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+
+class ComfyUIClient:
+    """Async ComfyUI HTTP client sharing one keep-alive connection pool across requests."""
+
+    def __init__(
+        self,
+        connect_timeout: float = settings.COMFYUI_CONNECT_TIMEOUT,
+        read_timeout: float = settings.COMFYUI_READ_TIMEOUT,
+        max_retries: int = settings.COMFYUI_MAX_RETRIES,
+        retry_backoff: float = settings.COMFYUI_RETRY_BACKOFF,
+        max_connections: int = settings.COMFYUI_MAX_CONNECTIONS,
+        max_keepalive: int = settings.COMFYUI_MAX_KEEPALIVE,
+    ):
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """The shared httpx client, created on first use so it binds to the running loop."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(
+        self,
+        method: str,
+        server_address: str,
+        path: str,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        stream: bool = False,
+        **kwargs,
+    ) -> httpx.Response:
+        """Sends a request to ComfyUI, retrying transient failures with exponential backoff.
+
+        Non-idempotent requests (POST) are only retried when the connection could not be
+        established, so a prompt is never queued twice. With ``stream=True`` the body is left
+        unread and the caller must ``aclose()`` the response.
+        """
+        url = f"http://{server_address}{path}"
+        retries = self.max_retries if retries is None else retries
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=self.timeout.connect)
+        idempotent = method.upper() in ("GET", "HEAD")
+
+        attempt = 0
         while True:
-            response = requests.get(f"http://{server_address}/history/{prompt_id}")
-            response.raise_for_status()
-            history_data = response.json()
-
-            if prompt_id not in history_data:
-                logger.info(f"Waiting... {counter} seconds (Prompt ID {prompt_id} not found yet)")
-                counter += 1
-                time.sleep(1)
-                continue
-
-            status = history_data[prompt_id].get("status", {}).get("completed", False)
-            if status:
-                logger.info(f"Image generation completed in {counter} seconds!")
-                return history_data
-
-            logger.info(f"Still processing... {counter} seconds elapsed")
-            counter += 1
-            time.sleep(1)
-    except Exception as e:
-        logger.error(f"Error tracking progress: {str(e)}")
-        return {"error": str(e)}
-
-def get_image(server_address: str, filename: str) -> Dict[str, Any]:
-    """Fetches the generated image from ComfyUI."""
-    try:
-        params = {"filename": filename, "subfolder": "", "type": "output"}
-        response = requests.get(f"http://{server_address}/view", params=params)
-        response.raise_for_status()
-        return {
-            "filename": filename,
-            "image_data": io.BytesIO(response.content).getvalue()
-        }
-    except Exception as e:
-        logger.error(f"Error fetching image: {str(e)}")
-        return {"error": str(e)}
\ No newline at end of file
+            try:
+                request = self.http.build_request(method, url, **kwargs)
+                response = await self.http.send(request, stream=stream)
+                if stream and not response.is_success:
+                    await response.aread()
+                response.raise_for_status()
+                return response
+            except httpx.HTTPError as e:
+                if attempt >= retries or not self._is_retryable(e, idempotent):
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                attempt += 1
+                logger.warning(f"{method} {url} failed ({e}); retry {attempt}/{retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _is_retryable(error: httpx.HTTPError, idempotent: bool) -> bool:
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+            return True
+        if not idempotent:
+            return False
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(error, httpx.TransportError)
+
+    async def queue_prompt(
+        self, server_address: str, client_id: str, prompt: Dict, timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        payload = {"prompt": prompt, "client_id": client_id}
+        with track("queue_prompt"):
+            response = await self.request("POST", server_address, "/prompt", json=payload, timeout=timeout)
+        return response.json()
+
+    async def get_history(
+        self, server_address: str, prompt_id: Optional[str] = None, timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        path = f"/history/{prompt_id}" if prompt_id else "/history"
+        response = await self.request("GET", server_address, path, timeout=timeout)
+        return response.json()
+
+    async def upload_image(
+        self,
+        server_address: str,
+        filename: str,
+        content: bytes,
+        content_type: str = "image/png",
+        folder_type: str = "input",
+        image_type: str = "image",
+        overwrite: bool = False,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        files = {"image": (filename, content, content_type)}
+        data = {"type": folder_type, "overwrite": "true" if overwrite else "false"}
+        with track("upload_image"):
+            response = await self.request(
+                "POST", server_address, f"/upload/{image_type}", files=files, data=data, timeout=timeout
+            )
+        return response.json()
+
+    async def view(
+        self,
+        server_address: str,
+        filename: str,
+        subfolder: str = "",
+        folder_type: str = "output",
+        timeout: Optional[float] = None,
+    ) -> bytes:
+        params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
+        with track("get_image"):
+            response = await self.request("GET", server_address, "/view", params=params, timeout=timeout)
+        return response.content
+
+    async def open_view(
+        self,
+        server_address: str,
+        filename: str,
+        subfolder: str = "",
+        folder_type: str = "output",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """Opens /view without reading the body, for relaying it chunk by chunk.
+
+        Only the time to the response headers is recorded as ``get_image_open``.
+        """
+        params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
+        with track("get_image_open"):
+            return await self.request("GET", server_address, "/view", params=params, headers=headers, stream=True)
+
+
+comfyui_client = ComfyUIClient()
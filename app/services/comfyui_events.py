@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, Optional
+
+import websockets
+
+from app.core.config import settings
+from app.services.comfyui import ComfyUIClient, comfyui_client
+
+logger = logging.getLogger(__name__)
+
+# Called with (event type, event data) for every /ws event of a subscribed prompt.
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class ComfyUIExecutionError(Exception):
+    """Raised when ComfyUI reports that a prompt failed or was interrupted."""
+
+
+class ComfyUIEventListener:
+    """One long-lived /ws connection per ComfyUI server, demultiplexing events by prompt_id.
+
+    Prompts must be queued with ``listener.client_id`` so ComfyUI routes their events to this
+    socket. Waiters are resolved as soon as the completion event arrives; the history endpoint
+    is only polled as a slow safety net and after reconnects. Callbacks registered with
+    ``subscribe`` receive every event for their prompt (executing, progress, executed, ...).
+    """
+
+    # Completion events that arrive before anyone waits on them (the prompt can finish before
+    # the /prompt response is processed) are remembered for a while.
+    MAX_FINISHED = 1024
+
+    def __init__(self, server_address: str, client: ComfyUIClient = comfyui_client):
+        self.server_address = server_address
+        self.client = client
+        self.client_id = str(uuid.uuid4())
+        self.connected = asyncio.Event()
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._finished: "OrderedDict[str, Optional[Exception]]" = OrderedDict()
+        self._started: "OrderedDict[str, float]" = OrderedDict()
+        self._subscribers: Dict[str, List[EventCallback]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=f"comfyui-ws-{self.server_address}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for future in self._waiters.values():
+            if not future.done():
+                future.cancel()
+        self._waiters.clear()
+
+    async def _run(self):
+        uri = f"ws://{self.server_address}/ws?clientId={self.client_id}"
+        delay = settings.COMFYUI_WS_RECONNECT_DELAY
+        while True:
+            try:
+                async with websockets.connect(uri, max_size=None, ping_interval=20) as ws:
+                    logger.info(f"Listening for ComfyUI events on {uri}")
+                    self.connected.set()
+                    delay = settings.COMFYUI_WS_RECONNECT_DELAY
+                    # Anything that finished while we were disconnected is only visible in history.
+                    for prompt_id in list(self._waiters):
+                        asyncio.create_task(self._check_history(prompt_id))
+                    async for message in ws:
+                        if isinstance(message, str):
+                            self._dispatch(json.loads(message))
+            except asyncio.CancelledError:
+                self.connected.clear()
+                raise
+            except Exception as e:
+                logger.warning(f"ComfyUI event stream {uri} dropped: {str(e)}; reconnecting in {delay:.0f}s")
+            self.connected.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def _dispatch(self, message: Dict[str, Any]):
+        event = message.get("type")
+        data = message.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if not prompt_id:
+            return
+
+        for callback in list(self._subscribers.get(prompt_id, ())):
+            try:
+                callback(event, data)
+            except Exception as e:
+                logger.error(f"Event callback for {prompt_id} failed: {str(e)}")
+
+        if event == "execution_start":
+            self._started[prompt_id] = time.monotonic()
+            while len(self._started) > self.MAX_FINISHED:
+                self._started.popitem(last=False)
+        elif event == "executing" and data.get("node") is None:
+            self._finish(prompt_id)
+        elif event == "execution_success":
+            self._finish(prompt_id)
+        elif event == "execution_error":
+            self._finish(prompt_id, ComfyUIExecutionError(
+                f"{data.get('node_type', 'node')} {data.get('node_id', '')} failed: {data.get('exception_message', 'unknown error')}"
+            ))
+        elif event == "execution_interrupted":
+            self._finish(prompt_id, ComfyUIExecutionError(f"Prompt {prompt_id} was interrupted"))
+
+    def _finish(self, prompt_id: str, error: Optional[Exception] = None):
+        future = self._waiters.get(prompt_id)
+        if future is not None:
+            if not future.done():
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+            return
+        self._finished[prompt_id] = error
+        self._finished.move_to_end(prompt_id)
+        while len(self._finished) > self.MAX_FINISHED:
+            self._finished.popitem(last=False)
+
+    def started_at(self, prompt_id: str) -> Optional[float]:
+        """``time.monotonic()`` at which ComfyUI began executing the prompt, if it was seen."""
+        return self._started.pop(prompt_id, None)
+
+    def subscribe(self, prompt_id: str, callback: EventCallback):
+        self._subscribers.setdefault(prompt_id, []).append(callback)
+
+    def unsubscribe(self, prompt_id: str, callback: EventCallback):
+        callbacks = self._subscribers.get(prompt_id)
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._subscribers[prompt_id]
+
+    async def ready(self, timeout: float = 5) -> bool:
+        """Waits briefly for the socket so events for the next prompt are not missed."""
+        self.start()
+        try:
+            await asyncio.wait_for(self.connected.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _check_history(self, prompt_id: str) -> bool:
+        """Resolves the waiter from /history if the prompt already completed."""
+        try:
+            history = await self.client.get_history(self.server_address, prompt_id)
+        except Exception as e:
+            logger.warning(f"History check for {prompt_id} failed: {str(e)}")
+            return False
+        entry = history.get(prompt_id)
+        if not entry:
+            return False
+        status = entry.get("status", {})
+        if status.get("status_str") == "error":
+            self._finish(prompt_id, ComfyUIExecutionError(f"Prompt {prompt_id} failed"))
+            return True
+        if status.get("completed", False) or entry.get("outputs"):
+            self._finish(prompt_id)
+            return True
+        return False
+
+    async def wait_for(self, prompt_id: str, timeout: float = settings.COMFYUI_JOB_TIMEOUT) -> Dict[str, Any]:
+        """Waits for a queued prompt to finish and returns its /history entry."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = self._waiters.get(prompt_id)
+        if future is None:
+            future = loop.create_future()
+            self._waiters[prompt_id] = future
+            if prompt_id in self._finished:
+                error = self._finished.pop(prompt_id)
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+        deadline = loop.time() + timeout
+        try:
+            while not future.done():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"Prompt {prompt_id} did not finish within {timeout:.0f}s")
+                # Without a live socket we fall back to polling history every second.
+                interval = settings.COMFYUI_HISTORY_FALLBACK_INTERVAL if self.connected.is_set() else 1.0
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), min(remaining, interval))
+                except asyncio.TimeoutError:
+                    await self._check_history(prompt_id)
+            future.result()
+        finally:
+            self._waiters.pop(prompt_id, None)
+
+        history = await self.client.get_history(self.server_address, prompt_id)
+        return history[prompt_id]
+
+
+listeners: Dict[str, ComfyUIEventListener] = {}
+
+
+def get_listener(server_address: str) -> ComfyUIEventListener:
+    """Returns the shared event listener for a ComfyUI server, starting it on first use."""
+    listener = listeners.get(server_address)
+    if listener is None:
+        listener = ComfyUIEventListener(server_address)
+        listeners[server_address] = listener
+    listener.start()
+    return listener
+
+
+async def stop_listeners():
+    for listener in listeners.values():
+        await listener.stop()
+    listeners.clear()
+
+
+async def track_progress(server_address: str, prompt_id: str) -> Dict[str, Any]:
+    """Waits for a prompt queued with the listener's client_id and returns its history."""
+    try:
+        entry = await get_listener(server_address).wait_for(prompt_id)
+        logger.info(f"Prompt {prompt_id} completed")
+        return {prompt_id: entry}
+    except Exception as e:
+        logger.error(f"Error tracking progress: {str(e)}")
+        return {"error": str(e)}
@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EditSession:
+    """Repeated inpaint edits of one source image with one workflow.
+
+    The session remembers the backend its last edit ran on, so the next edit can go back to
+    it and ComfyUI can reuse the outputs of every node whose inputs did not change (checkpoint
+    and VAE loads, the encoded source image, unchanged text encodes).
+    """
+
+    def __init__(self, session_id: str, workflow: str):
+        self.id = session_id
+        self.workflow = workflow
+        self.backend_address: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.edits = 0
+        self.backend_switches = 0
+        self.nodes_total = 0
+        self.nodes_cached = 0
+        self.last_edit: Dict[str, Any] = {}
+
+    def record(self, backend_address: str, nodes_total: int, nodes_cached: int):
+        if self.backend_address is not None and backend_address != self.backend_address:
+            self.backend_switches += 1
+        self.backend_address = backend_address
+        self.edits += 1
+        self.nodes_total += nodes_total
+        self.nodes_cached += nodes_cached
+        self.last_edit = {"backend": backend_address, "nodes_total": nodes_total, "nodes_cached": nodes_cached}
+        self.updated_at = time.time()
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        return self.nodes_cached / self.nodes_total if self.nodes_total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "workflow": self.workflow,
+            "backend": self.backend_address,
+            "edits": self.edits,
+            "backend_switches": self.backend_switches,
+            "nodes_total": self.nodes_total,
+            "nodes_cached": self.nodes_cached,
+            "cache_hit_ratio": round(self.cache_hit_ratio, 4),
+            "last_edit": self.last_edit,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class CachedNodeCollector:
+    """ComfyUI event callback that collects the node ids a prompt served from cache."""
+
+    def __init__(self):
+        self.nodes: Set[str] = set()
+
+    def __call__(self, event: str, data: Dict[str, Any]):
+        if event == "execution_cached":
+            self.add(data.get("nodes") or ())
+
+    def add(self, nodes: Iterable[Any]):
+        self.nodes.update(str(node) for node in nodes)
+
+    def add_history(self, status: Dict[str, Any]):
+        """Picks up ``execution_cached`` from a history entry, in case the event beat the subscription."""
+        for message in status.get("messages") or ():
+            if isinstance(message, list) and len(message) == 2 and message[0] == "execution_cached":
+                self.add((message[1] or {}).get("nodes") or ())
+
+
+class EditSessionManager:
+    """Edit sessions keyed by workflow and the sha256 of the source image.
+
+    Sessions are kept for ``ttl`` seconds after their last edit, and at most ``max_sessions``.
+    """
+
+    def __init__(self, max_sessions: int = settings.INPAINT_SESSION_MAX, ttl: float = settings.INPAINT_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, EditSession]" = OrderedDict()
+
+    @staticmethod
+    def session_id(workflow: str, source: bytes) -> str:
+        digest = hashlib.sha256(source).hexdigest()
+        return hashlib.sha256(f"{workflow}:{digest}".encode("utf-8")).hexdigest()[:24]
+
+    def open(self, workflow: str, source: bytes) -> EditSession:
+        """Returns the session editing ``source`` with ``workflow``, starting one if needed."""
+        self._evict()
+        session_id = self.session_id(workflow, source)
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = EditSession(session_id, workflow)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def placement(self, session: EditSession, addresses: Iterable[str]) -> Optional[str]:
+        """Backend the session should run on: its own, else the one hosting the fewest sessions.
+
+        Spreading new sessions keeps one session's edits from evicting another's cached nodes;
+        None leaves the choice to the scheduler when every backend hosts as many sessions.
+        """
+        if session.backend_address is not None:
+            return session.backend_address
+        counts = {address: 0 for address in addresses}
+        for other in self._sessions.values():
+            if other.backend_address in counts:
+                counts[other.backend_address] += 1
+        if len(set(counts.values())) <= 1:
+            return None
+        return min(counts, key=counts.get)
+
+    def get(self, session_id: str) -> Optional[EditSession]:
+        return self._sessions.get(session_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        self._evict()
+        return [session.to_dict() for session in reversed(self._sessions.values())]
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.updated_at >= cutoff and len(self._sessions) < self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def get_stats(self) -> Dict[str, Any]:
+        sessions = list(self._sessions.values())
+        total = sum(session.nodes_total for session in sessions)
+        cached = sum(session.nodes_cached for session in sessions)
+        return {
+            "sessions": len(sessions),
+            "edits": sum(session.edits for session in sessions),
+            "backend_switches": sum(session.backend_switches for session in sessions),
+            "nodes_total": total,
+            "nodes_cached": cached,
+            "cache_hit_ratio": round(cached / total, 4) if total else 0.0,
+        }
+
+
+edit_sessions = EditSessionManager()
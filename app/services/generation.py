@@ -0,0 +1,111 @@
+import logging
+import time
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from app.core.metrics import observe
+from app.services.backend_pool import ComfyUIBackend, backend_pool
+from app.services.comfyui import comfyui_client
+from app.services.comfyui_events import ComfyUIExecutionError, EventCallback, get_listener
+from app.services.image_cache import workflow_hash
+from app.services.scheduler import scheduler
+from app.services.workflows import workflow_models
+from app.utils.cache import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+workflow_flights = SingleFlight()
+# Event callbacks of every caller sharing an in-flight workflow, keyed like the flight.
+_flight_callbacks: Dict[Tuple[str, str], List[EventCallback]] = {}
+
+
+def _fan_out(key: Tuple[str, str]) -> EventCallback:
+    def on_event(event: str, data: Dict[str, Any]):
+        for callback in list(_flight_callbacks.get(key, ())):
+            callback(event, data)
+    return on_event
+
+
+async def run_workflow(
+    workflow: Dict[str, Any],
+    on_event: Optional[EventCallback] = None,
+    backend: Optional[ComfyUIBackend] = None,
+    client_id: str = "anonymous",
+    priority: str = "interactive",
+    on_queued: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """Queues a workflow and waits for it to finish.
+
+    Without ``backend`` the scheduler picks one once ``client_id`` is due a slot at
+    ``priority``, and concurrent calls with an identical graph and priority share one
+    submission (scheduled for whichever caller came first); a caller passing ``backend`` must already hold a
+    scheduler slot for it, and only such a caller gets ``on_queued(prompt_id)`` once ComfyUI
+    accepted the prompt. Returns the backend address, the prompt_id and the ``outputs`` and
+    ``status`` of the history entry; the result is shared between coalesced callers and must
+    not be modified.
+    """
+    if backend is None:
+        # Flights are per priority class: an interactive caller never waits behind a batch
+        # flight's place in the queue. Within a class the flight is scheduled, and counted
+        # against the quota, as the first caller's; the others ride along at no cost, which is
+        # fair because the backend does the work once.
+        key = (workflow_hash(workflow), priority)
+
+        async def submit() -> Dict[str, Any]:
+            async with scheduler.slot(client_id, priority, workflow_models(workflow)) as backend:
+                return await run_workflow(workflow, _fan_out(key), backend)
+
+        if on_event is not None:
+            _flight_callbacks.setdefault(key, []).append(on_event)
+        try:
+            return await workflow_flights.do(key, submit)
+        finally:
+            if on_event is not None:
+                callbacks = _flight_callbacks[key]
+                callbacks.remove(on_event)
+                if not callbacks:
+                    del _flight_callbacks[key]
+
+    async with backend_pool.lease(backend) as backend:
+        listener = get_listener(backend.address)
+        await listener.ready()
+        result = await comfyui_client.queue_prompt(backend.address, listener.client_id, workflow)
+        prompt_id = result.get("prompt_id")
+        if not prompt_id:
+            raise ComfyUIExecutionError(f"ComfyUI did not return a prompt_id: {result}")
+        queued_at = time.monotonic()
+        logger.info(f"Queued prompt {prompt_id} on {backend.address}")
+        if on_queued is not None:
+            on_queued(prompt_id)
+
+        if on_event is not None:
+            listener.subscribe(prompt_id, on_event)
+        try:
+            entry = await listener.wait_for(prompt_id)
+        finally:
+            if on_event is not None:
+                listener.unsubscribe(prompt_id, on_event)
+            finished_at = time.monotonic()
+            started_at = listener.started_at(prompt_id)
+
+        observe("comfyui_total", finished_at - queued_at)
+        if started_at is not None:
+            observe("comfyui_queue_wait", started_at - queued_at)
+            observe("comfyui_execution", finished_at - started_at)
+
+    return {
+        "server_address": backend.address,
+        "prompt_id": prompt_id,
+        "outputs": entry.get("outputs", {}),
+        "status": entry.get("status", {}),
+    }
+
+
+def output_images(outputs: Dict[str, Any], node_id: str) -> List[Dict[str, Any]]:
+    """Returns the image records (filename, subfolder, type) a SaveImage node produced."""
+    try:
+        images = outputs[node_id]["images"]
+    except KeyError:
+        raise ComfyUIExecutionError(f"Node {node_id} produced no images")
+    if not images:
+        raise ComfyUIExecutionError(f"Node {node_id} produced no images")
+    return images
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def workflow_hash(workflow: Dict[str, Any]) -> str:
+    """Canonical hash of a workflow graph: node ids, class types and inputs, ignoring ``_meta``."""
+    graph = {
+        node_id: {"class_type": node.get("class_type"), "inputs": node.get("inputs", {})}
+        for node_id, node in workflow.items()
+    }
+    canonical = json.dumps(graph, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def cache_key(workflow: Dict[str, Any], output_node: str, index: int = 0) -> str:
+    """Key of the ``index``-th image a workflow's ``output_node`` produces."""
+    return hashlib.sha256(f"{workflow_hash(workflow)}:{output_node}:{index}".encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """Two-tier cache of generated images keyed by ``cache_key``.
+
+    The memory tier is an LRU bounded by total bytes; evicted entries stay on disk, where the
+    least recently used files are deleted once the directory exceeds ``max_disk_bytes``.
+    """
+
+    def __init__(
+        self,
+        directory: str = settings.IMAGE_CACHE_DIR,
+        max_memory_bytes: int = settings.IMAGE_CACHE_MEMORY_BYTES,
+        max_disk_bytes: int = settings.IMAGE_CACHE_DISK_BYTES,
+        suffix: str = ".png",
+    ):
+        self.directory = directory
+        self.suffix = suffix
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_loaded = False
+        self._disk_lock = asyncio.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}{self.suffix}")
+
+    async def _ensure_disk_index(self):
+        """Indexes files left by a previous run, oldest access first.
+
+        Lookups wait for the scan, so files already on disk are never reported as misses.
+        """
+        if self._disk_loaded:
+            return
+        async with self._disk_lock:
+            if self._disk_loaded:
+                return
+            for _, key, size in sorted(await asyncio.to_thread(self._scan)):
+                self._disk[key] = size
+                self._disk_bytes += size
+            self._disk_loaded = True
+
+    def _scan(self):
+        """Lists cached files and deletes ``.tmp`` files left by writes a crash interrupted.
+
+        Recent ``.tmp`` files are spared: another worker sharing the directory may be writing them.
+        """
+        entries = []
+        stale_before = time.time() - 60
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith(f"{self.suffix}.tmp"):
+                        try:
+                            if os.stat(os.path.join(root, name)).st_mtime < stale_before:
+                                os.remove(os.path.join(root, name))
+                        except OSError:
+                            pass
+                    elif name.endswith(self.suffix):
+                        stat = os.stat(os.path.join(root, name))
+                        entries.append((stat.st_mtime, name[:-len(self.suffix)], stat.st_size))
+        return entries
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return data
+
+        await self._ensure_disk_index()
+        if key in self._disk:
+            try:
+                data = await asyncio.to_thread(self._read, key)
+            except OSError as e:
+                logger.warning(f"Dropping unreadable cache entry {key}: {str(e)}")
+                self._disk_bytes -= self._disk.pop(key)
+            else:
+                self._disk.move_to_end(key)
+                self._remember(key, data)
+                self.stats["disk_hits"] += 1
+                return data
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, data: bytes):
+        self.stats["stores"] += 1
+        self._remember(key, data)
+        if self.max_disk_bytes <= 0:
+            return
+        await self._ensure_disk_index()
+        try:
+            await asyncio.to_thread(self._write, key, data)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {key}: {str(e)}")
+            return
+        self._disk_bytes += len(data) - self._disk.pop(key, 0)
+        self._disk[key] = len(data)
+        evicted = []
+        while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+            old_key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(old_key)
+        if evicted:
+            self.stats["evictions"] += len(evicted)
+            await asyncio.to_thread(self._remove, evicted)
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.max_memory_bytes:
+            return
+        self._memory_bytes += len(data) - len(self._memory.pop(key, b""))
+        self._memory[key] = data
+        while self._memory_bytes > self.max_memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+
+    def _read(self, key: str) -> bytes:
+        path = self._path(key)
+        with open(path, "rb") as file:
+            data = file.read()
+        os.utime(path)
+        return data
+
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def _remove(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return {
+            **self.stats,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
+
+
+image_cache = ImageCache()
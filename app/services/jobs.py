@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Any, List, Optional
+from urllib.parse import urlencode
+
+from app.core.config import settings
+from app.services.comfyui import comfyui_client
+from app.services.generation import run_workflow, output_images
+from app.services.image_cache import cache_key, image_cache
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ("completed", "failed")
+
+
+class JobQueueFullError(Exception):
+    """Raised when too many jobs are already waiting for a worker slot."""
+
+
+class Job:
+    """State of one background generation, plus the event queues of its live subscribers."""
+
+    def __init__(self, output_node: str):
+        self.id = str(uuid.uuid4())
+        self.output_node = output_node
+        self.status = "queued"
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.progress: Dict[str, Any] = {}
+        self.server_address: Optional[str] = None
+        self.prompt_id: Optional[str] = None
+        self.images: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self._subscribers: List[asyncio.Queue] = []
+
+    @property
+    def image_urls(self) -> List[str]:
+        return [
+            f"/image_cache/{image['cache_key']}" if image.get("cache_key")
+            else "/get_image?" + urlencode({"filename": image["filename"], "server_address": self.server_address})
+            for image in self.images
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "progress": self.progress,
+            "server_address": self.server_address,
+            "prompt_id": self.prompt_id,
+            "image_urls": self.image_urls,
+            "error": self.error,
+        }
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        self.updated_at = time.time()
+        for queue in self._subscribers:
+            queue.put_nowait((event, data))
+
+    def on_comfyui_event(self, event: str, data: Dict[str, Any]):
+        """Translates ComfyUI /ws events into job progress."""
+        if event == "executing" and data.get("node") is not None:
+            self.progress = {"node": data["node"]}
+            self.publish("progress", self.progress)
+        elif event == "progress":
+            self.progress = {"node": data.get("node"), "step": data.get("value"), "total_steps": data.get("max")}
+            self.publish("progress", self.progress)
+
+    def set_status(self, status: str, **fields):
+        self.status = status
+        for key, value in fields.items():
+            setattr(self, key, value)
+        self.publish(status, self.to_dict())
+
+    async def events(self) -> AsyncIterator[tuple]:
+        """Yields (event, data) pairs, starting with the current state, until the job ends."""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        try:
+            yield self.status, self.to_dict()
+            if self.status in TERMINAL_STATES:
+                return
+            while True:
+                event, data = await queue.get()
+                yield event, data
+                if event in TERMINAL_STATES:
+                    return
+        finally:
+            self._subscribers.remove(queue)
+
+
+class JobManager:
+    """Runs generation jobs in the background with bounded concurrency and queue length.
+
+    At most ``max_concurrency`` workflows are in flight; ``max_pending`` caps how many more may
+    wait, so a burst is rejected instead of growing memory. Finished jobs are kept for
+    ``retention`` seconds (and at most ``max_jobs`` of them) so clients can fetch the result.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = settings.JOB_MAX_CONCURRENCY,
+        max_pending: int = settings.JOB_MAX_PENDING,
+        max_jobs: int = settings.JOB_MAX_RETAINED,
+        retention: float = settings.JOB_RETENTION_SECONDS,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.max_jobs = max_jobs
+        self.retention = retention
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def submit(
+        self,
+        workflow: Dict[str, Any],
+        output_node: str = "9",
+        client_id: str = "anonymous",
+        priority: str = "batch",
+    ) -> Job:
+        pending = sum(1 for job in self._jobs.values() if job.status == "queued")
+        if pending >= self.max_pending:
+            raise JobQueueFullError(f"{pending} jobs already waiting; try again later")
+        self._evict()
+        job = Job(output_node)
+        self._jobs[job.id] = job
+        task = asyncio.create_task(self._run(job, workflow, client_id, priority))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: Job, workflow: Dict[str, Any], client_id: str, priority: str):
+        key = cache_key(workflow, job.output_node)
+        if await image_cache.get(key) is not None:
+            job.set_status("completed", images=[{"filename": f"{key}.png", "cache_key": key}])
+            return
+
+        async with self.semaphore:
+            job.set_status("running")
+            try:
+                result = await run_workflow(
+                    workflow, on_event=job.on_comfyui_event, client_id=client_id, priority=priority
+                )
+                job.server_address = result["server_address"]
+                job.prompt_id = result["prompt_id"]
+                images = list(output_images(result["outputs"], job.output_node))
+                # Keep the first image locally so repeats of this workflow skip ComfyUI entirely.
+                first = images[0]
+                data = await comfyui_client.view(
+                    job.server_address, first["filename"], first.get("subfolder", ""), first.get("type", "output")
+                )
+                await image_cache.put(key, data)
+                images[0] = {**first, "cache_key": key}
+                job.set_status("completed", images=images)
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {str(e)}")
+                job.set_status("failed", error=str(e))
+
+    def _evict(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            expired = job.status in TERMINAL_STATES and now - job.updated_at > self.retention
+            if expired or (len(self._jobs) >= self.max_jobs and job.status in TERMINAL_STATES):
+                del self._jobs[job_id]
+
+    async def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+job_manager = JobManager()
@@ -0,0 +1,87 @@
+import logging
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from app.services.prompt_templates import (
+    post_type_prompts, post_type_properties, post_type_fields,
+    FIELD_PROMPT_MAP, creative_guidelines, extension
+)
+
+logger = logging.getLogger(__name__)
+
+GENERAL_FIELDS = ["message", "brand_name", "font", "colors"]
+
+_SENTINEL = "\x00value\x00"
+
+
+def _compile_field(field: str, render: Callable[[Any], str]):
+    """Splits a ``FIELD_PROMPT_MAP`` lambda into the text around its value.
+
+    Falls back to the lambda itself if it does not render as ``prefix + value + suffix``.
+    """
+    rendered = render(_SENTINEL)
+    if rendered.count(_SENTINEL) == 1:
+        prefix, suffix = rendered.split(_SENTINEL)
+        if render("probe") == f"{prefix}probe{suffix}":
+            return prefix, suffix
+    logger.warning(f"Prompt field '{field}' cannot be precompiled; rendering it per call")
+    return render
+
+
+class CompiledPrompt:
+    """The assembled prompt of one post type with every constant part already concatenated.
+
+    ``head`` holds the post type intro and properties, ``tail`` the creative guidelines and
+    the shared extension; in between only the fields a request actually fills are rendered.
+    """
+
+    __slots__ = ("post_type", "head", "fields", "tail")
+
+    def __init__(self, post_type: str):
+        self.post_type = post_type
+        head = [post_type_prompts.get(post_type, "")]
+        properties = post_type_properties.get(post_type, {})
+        head.append(" ".join(f"{key}: {value}" for key, value in properties.items() if value))
+        self.head = "".join(head)
+
+        fields: List[Tuple[str, Any]] = []
+        for field in post_type_fields.get(post_type, []) + GENERAL_FIELDS:
+            fields.append((field, _compile_field(field, FIELD_PROMPT_MAP[field])))
+        self.fields = tuple(fields)
+        self.tail = creative_guidelines.get(post_type, "") + (extension or "")
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        parts = [self.head]
+        for field, template in self.fields:
+            value = values.get(field)
+            if not value:
+                continue
+            if isinstance(template, tuple):
+                parts.append(f"{template[0]}{value}{template[1]}")
+            else:
+                parts.append(template(value))
+        parts.append(self.tail)
+        return "".join(parts)
+
+
+def _compile_all() -> Dict[str, CompiledPrompt]:
+    post_types = set(post_type_prompts) | set(post_type_properties) | set(post_type_fields) | set(creative_guidelines)
+    return {post_type: CompiledPrompt(post_type) for post_type in post_types}
+
+
+compiled_prompts = _compile_all()
+_generic_prompt = CompiledPrompt("")
+
+
+def assemble_prompt(request_data: Mapping[str, Any]) -> str:
+    """Builds the prompt sent to the prompt generator for one request."""
+    post_type = (request_data.get("post_type") or "").strip().lower()
+    return compiled_prompts.get(post_type, _generic_prompt).render(request_data)
+
+
+def assemble_prompts(rows: List[Mapping[str, Any]]) -> List[Optional[str]]:
+    """Assembles many requests at once; rows with an unknown post type yield ``None``."""
+    prompts = []
+    for row in rows:
+        compiled = compiled_prompts.get((row.get("post_type") or "").strip().lower())
+        prompts.append(compiled.render(row) if compiled is not None and compiled.post_type in post_type_prompts else None)
+    return prompts
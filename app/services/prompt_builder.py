@@ -1,97 +1,249 @@
 import asyncio
-import websockets
-import uuid
-import json
+import functools
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Mapping, Optional, Tuple
 from gradio_client import Client
 from huggingface_hub import login
-import time
-from app.services.prompt_templates import (
-    post_type_prompts, post_type_properties, post_type_fields,
-    FIELD_PROMPT_MAP, creative_guidelines, extension
-)
-from app.api.routes import connect_to_comfy, queue_prompt as queue_prompt_route
+from app.core.config import settings
+from app.core.metrics import track
+from app.utils.cache import SingleFlight, TTLCache
+from app.utils.resilience import CircuitBreaker, LatencyWindow
+from app.services.workflows import workflow_registry
+from app.services.prompt_assembly import assemble_prompt
+from app.services.prompt_engine import local_engine
 
 logger = logging.getLogger(__name__)
 
-# ... (imports and other code remain the same)
-
-async def generate_prompt(request_data):
-    prompt_parts = []
-
-    post_type = request_data.get("post_type", "").strip().lower()
-
-    if post_type and post_type in post_type_prompts:
-        prompt_parts.append(post_type_prompts[post_type])
-
-    if post_type and post_type in post_type_properties:
-        properties = post_type_properties[post_type]
-        formatted_properties = " ".join(f"{key}: {value}" for key, value in properties.items() if value)
-        if formatted_properties:
-            prompt_parts.append(formatted_properties)
-
-    if post_type in post_type_fields:
-        for field in post_type_fields[post_type]:
-            field_value = request_data.get(field)
-            if field_value:
-                prompt_parts.append(FIELD_PROMPT_MAP[field](field_value))
+FALLBACK_POSITIVE = "Dynamic social media post, bold colors, modern typography, engaging composition"
+FALLBACK_NEGATIVE = "Blurry text, low contrast, cluttered design, outdated style"
+PROMPT_ENGINES = ("remote", "local", "auto")
+
+
+class PromptGeneratorClient:
+    """Lazily connected, reused client for the Hugging Face prompt generator Space.
+
+    Logging in and the gradio handshake happen once; the connection is dropped after a
+    failed call so the next call reconnects. Latencies of successful calls, and timed-out calls
+    at their timeout, drive the timeout of the next ones and, with ``hedge`` on, when a
+    duplicate call is fired. Calls run on a
+    thread pool of their own, so calls abandoned after a timeout cannot starve other threads.
+    """
+
+    def __init__(self, space: str = settings.PROMPT_GENERATOR_SPACE, hedge: bool = settings.PROMPT_HEDGE):
+        self.space = space
+        self.hedge = hedge
+        self.latency = LatencyWindow(settings.PROMPT_LATENCY_WINDOW)
+        self.stats = {"calls": 0, "timeouts": 0, "hedged": 0, "hedge_wins": 0}
+        self._client: Optional[Client] = None
+        self._logged_in = False
+        self._lock = asyncio.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=settings.PROMPT_GENERATOR_THREADS, thread_name_prefix="prompt")
+
+    def _connect(self) -> Client:
+        if not self._logged_in:
+            login("HF_TOKEN")
+            self._logged_in = True
+        return Client(self.space)
+
+    async def get_client(self) -> Client:
+        if self._client is None:
+            async with self._lock:
+                if self._client is None:
+                    self._client = await asyncio.to_thread(self._connect)
+        return self._client
+
+    def reset(self):
+        self._client = None
+
+    async def predict(self, prompt: str) -> Tuple[str, str]:
+        client = await self.get_client()
+        started = time.monotonic()
+        try:
+            with track("prompt_generate"):
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, functools.partial(client.predict, prompt=prompt, api_name="/generate")
+                )
+        except Exception:
+            self.reset()
+            raise
+        self.latency.add(time.monotonic() - started)
+        return result[0], result[1]
+
+    def timeout(self) -> float:
+        """Per-call timeout: a multiple of the recent p99, or ``PROMPT_TIMEOUT_COLD`` until there is history."""
+        p99 = self.latency.percentile(0.99)
+        if p99 is None:
+            return settings.PROMPT_TIMEOUT_COLD
+        return min(settings.PROMPT_TIMEOUT_MAX, max(settings.PROMPT_TIMEOUT_MIN, p99 * settings.PROMPT_TIMEOUT_FACTOR))
+
+    def deadline(self) -> float:
+        """Budget for a prompt including retries; a cold client gets no more than one call's worth."""
+        if self.latency.percentile(0.99) is None:
+            return min(settings.PROMPT_DEADLINE, settings.PROMPT_TIMEOUT_COLD)
+        return settings.PROMPT_DEADLINE
+
+    async def call(self, prompt: str, timeout: float) -> Tuple[str, str]:
+        """``predict`` bounded by ``timeout``, hedged with a second call once it passes the p95.
+
+        The first call to succeed wins and the other is abandoned; the gradio call itself runs
+        in a thread, so an abandoned call finishes in the background.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        p95 = self.latency.percentile(0.95) if self.hedge else None
+        hedge_at = loop.time() + p95 if p95 is not None else None
+        self.stats["calls"] += 1
+        first = asyncio.create_task(self.predict(prompt))
+        pending = {first}
+        try:
+            while True:
+                now = loop.time()
+                if now >= deadline:
+                    self.stats["timeouts"] += 1
+                    self.latency.add(timeout)
+                    raise asyncio.TimeoutError(f"Prompt generator did not answer within {timeout:.1f}s")
+                wake = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, pending = await asyncio.wait(pending, timeout=wake - now, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task is not first:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                if done and not pending:
+                    raise error
+                if hedge_at is not None and loop.time() >= hedge_at:
+                    hedge_at = None
+                    self.stats["hedged"] += 1
+                    pending.add(asyncio.create_task(self.predict(prompt)))
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def status(self):
+        return {**self.stats, "timeout": self.timeout(), "latency": self.latency.to_dict(), "hedge": self.hedge}
+
+
+prompt_client = PromptGeneratorClient()
+prompt_cache = TTLCache(max_size=settings.PROMPT_CACHE_SIZE, ttl=settings.PROMPT_CACHE_TTL)
+prompt_flights = SingleFlight()
+prompt_breaker = CircuitBreaker("prompt_generator", settings.PROMPT_BREAKER_FAILURES, settings.PROMPT_BREAKER_RESET)
+# Space calls that outlived a request's latency budget; referenced here until they finish.
+_overrun_calls: set = set()
+
+
+async def generate_positive_negative(final_prompt: str) -> Tuple[str, str]:
+    """Expands an assembled prompt into (positive, negative) with the Space, or the fixed fallback."""
+    return await remote_positive_negative(final_prompt) or (FALLBACK_POSITIVE, FALLBACK_NEGATIVE)
+
+
+async def remote_positive_negative(final_prompt: str) -> Optional[Tuple[str, str]]:
+    """Asks the Space to expand an assembled prompt, memoized by prompt text; None if it fails.
+
+    Concurrent requests for the same prompt text share one call to the Space.
+    """
+    cached = prompt_cache.get(final_prompt)
+    if cached is not None:
+        return cached
+    return await prompt_flights.do(final_prompt, lambda: _expand(final_prompt))
+
+
+async def expand_request(
+    request_data: Mapping[str, Any], engine: Optional[str] = None, budget: Optional[float] = None
+) -> Tuple[str, str, str]:
+    """Expands a request into (positive, negative, engine used) with the selected engine.
+
+    See ``PROMPT_ENGINE`` for how "remote", "local" and "auto" choose; ``budget`` overrides
+    ``PROMPT_LATENCY_BUDGET`` in seconds. A Space call that overruns the budget keeps running in
+    the background, so its latency, result and any failure still reach the window, the cache
+    and the breaker. Raises ValueError for an unknown engine.
+    """
+    engine = engine or settings.PROMPT_ENGINE
+    if engine not in PROMPT_ENGINES:
+        raise ValueError(f"prompt_engine must be one of: {', '.join(PROMPT_ENGINES)}")
+    if budget is None:
+        budget = settings.PROMPT_LATENCY_BUDGET or None
+
+    if engine != "local":
+        final_prompt = assemble_prompt(request_data)
+        result = prompt_cache.get(final_prompt)
+        if result is not None:
+            return (*result, "remote")
+        expected = prompt_client.latency.percentile(0.95)
+        too_slow = budget is not None and expected is not None and expected > budget
+        if engine == "remote" or not (prompt_breaker.is_open or too_slow):
+            try:
+                if engine == "auto" and budget is not None:
+                    call = asyncio.ensure_future(remote_positive_negative(final_prompt))
+                    _overrun_calls.add(call)
+                    call.add_done_callback(_overrun_done)
+                    result = await asyncio.wait_for(asyncio.shield(call), budget)
+                else:
+                    result = await remote_positive_negative(final_prompt)
+            except asyncio.TimeoutError:
+                logger.info(f"Prompt generator exceeded the {budget}s budget; expanding locally")
+            if result is not None:
+                return (*result, "remote")
+
+    return (*local_engine.expand(request_data), "local")
+
+
+def _overrun_done(call: asyncio.Future):
+    _overrun_calls.discard(call)
+    if not call.cancelled() and call.exception() is not None:
+        logger.warning(f"Background prompt generator call failed: {call.exception()}")
+
+
+async def _expand(final_prompt: str) -> Optional[Tuple[str, str]]:
+    """Calls the Space with backoff until its deadline; gives up at once while the breaker is open."""
+    max_retries = settings.PROMPT_RETRIES
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + prompt_client.deadline()
+    for attempt in range(max_retries):
+        if not prompt_breaker.allow():
+            logger.info("Prompt generator circuit is open; using fallback prompt")
+            break
+        logger.info(f"Prompt generator attempt {attempt + 1} of {max_retries}")
+        try:
+            result = await prompt_client.call(final_prompt, min(prompt_client.timeout(), deadline - loop.time()))
+        except Exception as e:
+            prompt_breaker.record_failure()
+            retry_delay = settings.PROMPT_RETRY_BACKOFF * 2 ** attempt
+            if attempt == max_retries - 1 or loop.time() + retry_delay >= deadline:
+                logger.warning(f"Failed to connect to Hugging Face Space after {attempt + 1} attempts: {str(e)}. Using fallback prompt.")
+                break
+            logger.warning(f"Attempt {attempt + 1} failed: {str(e)}. Retrying in {retry_delay} seconds...")
+            await asyncio.sleep(retry_delay)
+        else:
+            prompt_breaker.record_success()
+            prompt_cache.set(final_prompt, result)
+            return result
+    return None
 
-    general_fields = ["message", "brand_name", "font", "colors"]
-    for field in general_fields:
-        field_value = request_data.get(field)
-        if field_value:
-            prompt_parts.append(FIELD_PROMPT_MAP[field](field_value))
 
-    if post_type in creative_guidelines:
-        prompt_parts.append(creative_guidelines[post_type])
+def prompt_generator_status():
+    return {"breaker": prompt_breaker.to_dict(), **prompt_client.status()}
 
-    if extension:
-        prompt_parts.append(extension)
 
-    final_prompt = "".join(filter(None, prompt_parts))
+async def generate_prompt(request_data):
+    positive, negative, engine = await expand_request(
+        request_data, request_data.get("prompt_engine"), request_data.get("latency_budget")
+    )
 
-    login("HF_TOKEN")
-    max_retries = 3
-    retry_delay = 5
-    for attempt in range(max_retries):
-        print("Retry no ", attempt)
-        try:
-            client = Client("atharva-dev/prompt_generator")
-            result = client.predict(prompt=final_prompt, api_name="/generate")
-            positive = result[0]
-            negative = result[1]
-            break
-        except Exception as e:
-            if attempt == max_retries - 1:
-                positive = "Dynamic social media post, bold colors, modern typography, engaging composition"
-                negative = "Blurry text, low contrast, cluttered design, outdated style"
-                print(f"Failed to connect to Hugging Face Space after {max_retries} attempts: {str(e)}. Using mocked response.")
-            else:
-                print(f"Attempt {attempt + 1} failed: {str(e)}. Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-
-    print("Got the prompt")
     final_prompt = "Positive:\n" + positive + "\n\nNegative:\n" + negative
-    print("final Prompt", final_prompt)
+    logger.debug(f"Expanded prompt with the {engine} engine: {final_prompt}")
 
-    workflow_path = "app\\services\\tutorial.json"
     try:
-        print("Opening Json")
-        with open(workflow_path, 'r') as file:
-            data = json.load(file)
-
-        data["prompt"]["6"]["inputs"]["text"] = positive
-        data["prompt"]["7"]["inputs"]["text"] = negative
-
-        print("writing to json")
-        with open(workflow_path, 'w') as file:
-            json.dump(data, file, indent=4)
+        workflow = workflow_registry.get("tutorial").render(positive_text=positive, negative_text=negative)
 
         # Return the prompt and workflow data separately
         return {
             "generated_prompt": final_prompt,
-            "workflow_data": data["prompt"]  # Only the "prompt" part of the workflow
+            "workflow_data": workflow,
+            "prompt_engine": engine
         }
     except Exception as e:
-        print(f"Error updating ComfyUI workflow: {str(e)}")
+        logger.exception(f"Error updating ComfyUI workflow: {str(e)}")
         raise
\ No newline at end of file
@@ -0,0 +1,81 @@
+import re
+from typing import Any, Dict, List, Mapping, Tuple
+
+from app.services.prompt_assembly import GENERAL_FIELDS
+from app.services.prompt_templates import (
+    post_type_prompts, post_type_properties, post_type_fields,
+    FIELD_TAG_MAP, creative_guidelines, base_negative, negative_guidelines
+)
+
+QUALITY_TAGS = "highly detailed, sharp focus, professional graphic design, 4k"
+
+_BOLD = re.compile(r"\*\*([^*]+)\*\*")
+_GUIDELINE = re.compile(r"\*\*([^*:]+):\*\*")
+
+
+def _clean(value: Any) -> str:
+    return " ".join(str(value).replace("*", "").split())
+
+
+class LocalPrompt:
+    """Positive/negative prompt builder of one post type, with its constant tags precomputed.
+
+    The subject comes from the post type's intro, the style from its properties (or the intro
+    when it has none) and the headings of its creative guidelines; request fields are rendered
+    through ``FIELD_TAG_MAP``.
+    """
+
+    __slots__ = ("post_type", "subject", "style", "fields", "negative")
+
+    def __init__(self, post_type: str):
+        self.post_type = post_type
+        noun = post_type.replace("_", " ")
+        bold = _BOLD.findall(post_type_prompts.get(post_type, ""))
+        descriptor = bold[-1].strip() if bold else ""
+        self.subject = descriptor if noun in descriptor else " ".join(filter(None, [descriptor, noun]))
+
+        style = [value.strip() for value in post_type_properties.get(post_type, {}).values() if value and value.strip()]
+        headings = _GUIDELINE.findall(creative_guidelines.get(post_type, ""))
+        style += [heading.strip().lower() for heading in headings if "guidelines" not in heading.lower()]
+        self.style = ", ".join(style)
+
+        self.fields = tuple(
+            (field, FIELD_TAG_MAP[field]) for field in post_type_fields.get(post_type, []) + GENERAL_FIELDS
+        )
+        self.negative = ", ".join(filter(None, [negative_guidelines.get(post_type, ""), base_negative]))
+
+    def expand(self, values: Mapping[str, Any]) -> Tuple[str, str]:
+        parts: List[str] = [self.subject]
+        for field, render in self.fields:
+            value = values.get(field)
+            if value:
+                parts.append(render(_clean(value)))
+        if values.get("theme"):
+            parts.append(f"{_clean(values['theme'])} theme")
+        for key in ("keywords", "tags"):
+            if values.get(key):
+                parts.extend(_clean(item) for item in values[key] if item)
+        if values.get("platform"):
+            parts.append(f"composed for {_clean(values['platform'])}")
+        parts.append(self.style)
+        parts.append(QUALITY_TAGS)
+        return ", ".join(part for part in parts if part), self.negative
+
+
+class LocalPromptEngine:
+    """Deterministic, offline stand-in for the prompt generator Space.
+
+    The same request always expands to the same pair, in microseconds and without network.
+    """
+
+    def __init__(self):
+        post_types = set(post_type_prompts) | set(post_type_properties) | set(post_type_fields) | set(creative_guidelines)
+        self.prompts: Dict[str, LocalPrompt] = {post_type: LocalPrompt(post_type) for post_type in post_types}
+        self._generic = LocalPrompt("")
+
+    def expand(self, request_data: Mapping[str, Any]) -> Tuple[str, str]:
+        post_type = (request_data.get("post_type") or "").strip().lower()
+        return self.prompts.get(post_type, self._generic).expand(request_data)
+
+
+local_engine = LocalPromptEngine()
@@ -11,6 +11,20 @@ FIELD_PROMPT_MAP = {
     "achievement": lambda value: f"Showcase a remarkable achievement: **{value}**. Use sharp, bold text to ensure prominence and recognition.",
 }
 
+# Phrases the local prompt engine puts into a Stable Diffusion prompt for each field.
+FIELD_TAG_MAP = {
+    "trend": lambda value: f"inspired by the trend {value}",
+    "brand_name": lambda value: f"brand name \"{value}\" in sharp legible lettering",
+    "product_desc": lambda value: f"featuring {value}",
+    "job_desc": lambda value: f"hiring announcement for {value}",
+    "message": lambda value: f"large bold centered text \"{value}\"",
+    "font": lambda value: f"{value} typography",
+    "colors": lambda value: f"{value} color palette",
+    "festival_name": lambda value: f"{value} festival celebration",
+    "event_desc": lambda value: f"announcement of {value}",
+    "achievement": lambda value: f"celebrating {value}",
+}
+
 post_type_prompts = {
     "social_media_post": (
         "You are a Professional Prompt Engineer. Your task is to create a **visually compelling, engaging, and high-impact** image prompt "
@@ -114,6 +128,20 @@ creative_guidelines = {
     ),
 }
 
+base_negative = (
+    "blurry, low resolution, pixelated, jpeg artifacts, watermark, distorted text, misspelled text, "
+    "illegible lettering, deformed, bad anatomy, extra fingers, cropped, out of frame, oversaturated"
+)
+
+negative_guidelines = {
+    "social_media_post": "dull colors, flat composition, cluttered layout, outdated style, low contrast",
+    "meme_post": "unfunny, unclear punchline, realistic photo style, small text, busy background",
+    "job_post": "unprofessional, chaotic layout, playful cartoon style, clutter, harsh lighting",
+    "festival_post": "gloomy, muted colors, empty scene, culturally inaccurate symbols, dark mood",
+    "achievement_post": "dull, cheap look, plain background, weak lighting, cluttered design",
+    "event_announcement": "messy hierarchy, cheap design, cluttered layout, unreadable details, amateur look",
+}
+
 extension = (
     "\nGenerate a **unique, highly detailed, and visually compelling** AI image prompt for Stable Diffusion 3.5 Large Model."
     "The output should strictly contain only two components:\n"
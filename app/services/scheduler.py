@@ -0,0 +1,244 @@
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Any, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.services.backend_pool import BackendPool, ComfyUIBackend, NoHealthyBackendError, backend_pool
+
+logger = logging.getLogger(__name__)
+
+# Classes are served strictly in this order; within a class clients share by weight.
+PRIORITIES = ("interactive", "batch")
+
+
+class SchedulerTimeoutError(Exception):
+    """Raised when a request waited longer than the queue timeout for a backend slot."""
+
+
+class _Waiter:
+    __slots__ = ("client_id", "priority", "tag", "models", "prefer", "future")
+
+    def __init__(
+        self, client_id: str, priority: str, tag: float, models: Tuple[str, ...], prefer: Optional[str], future: asyncio.Future
+    ):
+        self.client_id = client_id
+        self.priority = priority
+        self.tag = tag
+        self.models = models
+        self.prefer = prefer
+        self.future = future
+
+
+class _Client:
+    """Per-client scheduling state: running count, queued waiters and virtual finish tag."""
+
+    __slots__ = ("weight", "running", "queues", "last_tag")
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.running = 0
+        self.queues: Dict[str, Deque[_Waiter]] = {priority: deque() for priority in PRIORITIES}
+        self.last_tag = 0.0
+
+
+class Scheduler:
+    """Admits ComfyUI work by priority class and weighted fair share across clients.
+
+    A request waits until a healthy backend has a free slot (``backend_slots`` jobs handed to
+    it and not yet finished) and its client is under ``client_quota`` running jobs. Among the
+    waiters of the highest non-empty priority class, the one with the smallest virtual finish
+    tag goes next; each request advances its client's tag by ``1 / weight``, so a client with
+    weight 2 gets twice the share of a client with weight 1 while both have work queued.
+
+    Backends remember the model files of the jobs they were last given. A job goes to a free
+    backend that has its models warm when there is one; otherwise a queued job of the same class
+    whose models are warm on a free backend may go first, as long as its tag is within
+    ``affinity_slack`` of the job that is due, so jobs for one model run back to back. A job
+    asking for a ``prefer``-red backend goes there whenever it is free, before model affinity.
+    """
+
+    def __init__(
+        self,
+        pool: BackendPool = backend_pool,
+        backend_slots: int = settings.SCHEDULER_BACKEND_SLOTS,
+        client_quota: int = settings.SCHEDULER_CLIENT_QUOTA,
+        client_weights: Optional[Dict[str, float]] = None,
+        queue_timeout: float = settings.SCHEDULER_QUEUE_TIMEOUT,
+        warm_models: int = settings.SCHEDULER_WARM_MODELS,
+        affinity_slack: float = settings.SCHEDULER_AFFINITY_SLACK,
+    ):
+        self.pool = pool
+        self.backend_slots = backend_slots
+        self.client_quota = client_quota
+        self.client_weights = dict(settings.SCHEDULER_CLIENT_WEIGHTS if client_weights is None else client_weights)
+        self.queue_timeout = queue_timeout
+        self.warm_models = warm_models
+        self.affinity_slack = affinity_slack
+        self._clients: Dict[str, _Client] = {}
+        self._assigned: Dict[str, int] = {}
+        self._virtual_time = 0.0
+        self.stats = {
+            "granted": 0, "timeouts": 0, "warm_starts": 0, "cold_starts": 0, "affinity_reorders": 0, "sticky_starts": 0
+        }
+
+    def _client(self, client_id: str) -> _Client:
+        client = self._clients.get(client_id)
+        if client is None:
+            client = self._clients[client_id] = _Client(self.client_weights.get(client_id, 1.0))
+        return client
+
+    @asynccontextmanager
+    async def slot(
+        self, client_id: str, priority: str = "interactive", models: Sequence[str] = (), prefer: Optional[str] = None
+    ):
+        """Waits for a backend slot on behalf of ``client_id`` and yields the chosen backend.
+
+        ``models`` are the model files the job loads (see ``workflow_models``), used for affinity;
+        ``prefer`` is the address of a backend to stick to when it has a free slot.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'")
+        if not any(backend.healthy for backend in self.pool.backends):
+            raise NoHealthyBackendError("No healthy ComfyUI backend available")
+
+        client = self._client(client_id)
+        # Start-time fair queueing: a returning client does not get credit for its idle time.
+        tag = max(self._virtual_time, client.last_tag) + 1.0 / client.weight
+        client.last_tag = tag
+        waiter = _Waiter(client_id, priority, tag, tuple(models), prefer, asyncio.get_running_loop().create_future())
+        client.queues[priority].append(waiter)
+        self._dispatch()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        try:
+            while not waiter.future.done():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self.stats["timeouts"] += 1
+                    raise SchedulerTimeoutError(f"No ComfyUI capacity within {self.queue_timeout:g}s")
+                try:
+                    # Re-check periodically: a backend may have come back without any release.
+                    await asyncio.wait_for(asyncio.shield(waiter.future), min(remaining, 1.0))
+                except asyncio.TimeoutError:
+                    self._dispatch()
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(client_id, waiter.future.result())
+            else:
+                waiter.future.cancel()
+                client.queues[priority].remove(waiter)
+            self._forget_idle(client_id)
+            raise
+
+        backend = waiter.future.result()
+        try:
+            yield backend
+        finally:
+            self._release(client_id, backend)
+            self._forget_idle(client_id)
+
+    def _dispatch(self):
+        while True:
+            free = self._free_backends()
+            if not free:
+                return
+            assignment = self._next_assignment(free)
+            if assignment is None:
+                return
+            waiter, backend = assignment
+            client = self._clients[waiter.client_id]
+            client.queues[waiter.priority].remove(waiter)
+            client.running += 1
+            self._assigned[backend.address] = self._assigned.get(backend.address, 0) + 1
+            self._virtual_time = max(self._virtual_time, waiter.tag - 1.0 / client.weight)
+            if waiter.models:
+                self.stats["warm_starts" if backend.is_warm(waiter.models) else "cold_starts"] += 1
+                backend.mark_warm(waiter.models, self.warm_models)
+            self.stats["granted"] += 1
+            waiter.future.set_result(backend)
+
+    def _free_backends(self) -> List[ComfyUIBackend]:
+        free = [
+            backend for backend in self.pool.backends
+            if backend.healthy and self._assigned.get(backend.address, 0) < self.backend_slots
+        ]
+        return self.pool.preferred(free)
+
+    def _next_assignment(self, free: List[ComfyUIBackend]) -> Optional[Tuple[_Waiter, ComfyUIBackend]]:
+        for priority in PRIORITIES:
+            eligible = [
+                client for client in self._clients.values()
+                if client.queues[priority] and client.running < self.client_quota
+            ]
+            if not eligible:
+                continue
+            due = min((client.queues[priority][0] for client in eligible), key=lambda waiter: waiter.tag)
+            horizon = due.tag + self.affinity_slack
+            candidates = sorted(
+                (waiter for client in eligible for waiter in client.queues[priority] if waiter.tag <= horizon),
+                key=lambda waiter: waiter.tag,
+            )
+            for waiter in candidates:
+                sticky = [backend for backend in free if backend.address == waiter.prefer]
+                if sticky:
+                    self.stats["sticky_starts"] += 1
+                    if waiter is not due:
+                        self.stats["affinity_reorders"] += 1
+                    return waiter, sticky[0]
+                warm = [backend for backend in free if backend.is_warm(waiter.models)]
+                if warm:
+                    if waiter is not due:
+                        self.stats["affinity_reorders"] += 1
+                    return waiter, self._least_busy(warm)
+            return due, self._coldest(free, due.models)
+        return None
+
+    def _least_busy(self, backends: List[ComfyUIBackend]) -> ComfyUIBackend:
+        return min(backends, key=lambda backend: (self._assigned.get(backend.address, 0), backend.load))
+
+    def _coldest(self, backends: List[ComfyUIBackend], models: Tuple[str, ...]) -> ComfyUIBackend:
+        """Prefers a backend already holding some of ``models``, then one with none warm to evict."""
+        return min(backends, key=lambda backend: (
+            -sum(model in backend.warm_models for model in models),
+            self._assigned.get(backend.address, 0),
+            bool(backend.warm_models),
+            backend.load,
+        ))
+
+    def _release(self, client_id: str, backend: ComfyUIBackend):
+        self._clients[client_id].running -= 1
+        self._assigned[backend.address] -= 1
+        self._dispatch()
+
+    def _forget_idle(self, client_id: str):
+        client = self._clients.get(client_id)
+        if client is not None and client.running == 0 and not any(client.queues.values()):
+            # With nothing queued or running it has no backlog left to account for.
+            del self._clients[client_id]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "backend_slots": self.backend_slots,
+            "client_quota": self.client_quota,
+            "assigned": dict(self._assigned),
+            "warm_models": {backend.address: backend.warm_models for backend in self.pool.backends},
+            "queued": {
+                priority: sum(len(client.queues[priority]) for client in self._clients.values())
+                for priority in PRIORITIES
+            },
+            "clients": {
+                client_id: {
+                    "running": client.running,
+                    "queued": {priority: len(queue) for priority, queue in client.queues.items() if queue},
+                    "weight": client.weight,
+                }
+                for client_id, client in self._clients.items()
+            },
+        }
+
+
+scheduler = Scheduler()
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import importlib.util
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from app.core.config import settings
+from app.services.image_cache import ImageCache
+from app.utils.cache import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# format name -> (Pillow format, media type, file extension)
+OUTPUT_FORMATS = {
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "jpg": ("JPEG", "image/jpeg", "jpg"),
+    "png": ("PNG", "image/png", "png"),
+}
+
+
+class TranscoderUnavailableError(Exception):
+    """Raised when Pillow is not installed."""
+
+
+class TranscodeOptions(NamedTuple):
+    """Target encoding of an output image; ``max_size`` bounds the longest side in pixels."""
+
+    format: str = "webp"
+    quality: int = settings.TRANSCODE_QUALITY
+    max_size: Optional[int] = None
+
+    @property
+    def media_type(self) -> str:
+        return OUTPUT_FORMATS[self.format][1]
+
+    @property
+    def extension(self) -> str:
+        return OUTPUT_FORMATS[self.format][2]
+
+
+def _encode(data: bytes, pil_format: str, quality: int, max_size: Optional[int]) -> bytes:
+    """Runs in a worker process: decodes, optionally downsizes and re-encodes one image."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if max_size:
+            image.thumbnail((max_size, max_size), Image.LANCZOS)
+        if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        if pil_format == "WEBP":
+            image.save(output, pil_format, quality=quality, method=4)
+        elif pil_format == "JPEG":
+            image.save(output, pil_format, quality=quality, optimize=True, progressive=True)
+        else:
+            image.save(output, pil_format, optimize=True)
+    return output.getvalue()
+
+
+class Transcoder:
+    """Re-encodes generated images in a process pool and caches every variant.
+
+    Variants are keyed by the source image's content key plus the options, so a source is
+    only downloaded and encoded once per variant; identical requests in flight share the work.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[ImageCache] = None,
+        workers: int = settings.TRANSCODE_WORKERS,
+    ):
+        self.cache = cache or ImageCache(
+            directory=settings.TRANSCODE_CACHE_DIR,
+            max_memory_bytes=settings.TRANSCODE_CACHE_MEMORY_BYTES,
+            max_disk_bytes=settings.TRANSCODE_CACHE_DISK_BYTES,
+            suffix=".bin",
+        )
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._flights = SingleFlight()
+        self.available = importlib.util.find_spec("PIL") is not None
+        self.stats = {"encoded": 0, "bytes_in": 0, "bytes_out": 0}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    @staticmethod
+    def variant_key(source_key: str, options: TranscodeOptions) -> str:
+        pil_format = OUTPUT_FORMATS[options.format][0]
+        return hashlib.sha256(f"{source_key}:{pil_format}:{options.quality}:{options.max_size}".encode("utf-8")).hexdigest()
+
+    async def transcode(
+        self, source_key: str, load: Callable[[], Awaitable[bytes]], options: TranscodeOptions
+    ) -> bytes:
+        """Returns the variant of the source identified by ``source_key``; ``load`` fetches it on a miss."""
+        if not self.available:
+            raise TranscoderUnavailableError("Image transcoding requires Pillow")
+        key = self.variant_key(source_key, options)
+        data = await self.cache.get(key)
+        if data is not None:
+            return data
+        return await self._flights.do(key, lambda: self._encode_variant(key, load, options))
+
+    async def _encode_variant(
+        self, key: str, load: Callable[[], Awaitable[bytes]], options: TranscodeOptions
+    ) -> bytes:
+        source = await load()
+        data = await asyncio.get_running_loop().run_in_executor(
+            self.executor, _encode, source, OUTPUT_FORMATS[options.format][0], options.quality, options.max_size
+        )
+        await self.cache.put(key, data)
+        self.stats["encoded"] += 1
+        self.stats["bytes_in"] += len(source)
+        self.stats["bytes_out"] += len(data)
+        logger.info(f"Encoded {options.format} variant {key[:12]}: {len(source)} -> {len(data)} bytes")
+        return data
+
+    def get_stats(self):
+        return {**self.stats, "coalesced": self._flights.stats["coalesced"], "cache": self.cache.get_stats()}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+transcoder = Transcoder()
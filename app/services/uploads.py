@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from app.core.config import settings
+from app.services.comfyui import ComfyUIClient, comfyui_client
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTracker:
+    """Skips uploads of content a ComfyUI backend already has.
+
+    Each backend file is remembered with the sha256 of the bytes last written to it, and an
+    upload is skipped only when that digest matches. Without an explicit filename the file is
+    stored under a content-addressed name, so a repeat upload (even from another process)
+    resolves to the same input file. Identical uploads running at the same time share one
+    request. Knowledge expires after ``ttl`` seconds in case a backend's input folder is wiped.
+    """
+
+    def __init__(
+        self,
+        client: ComfyUIClient = comfyui_client,
+        max_entries: int = settings.UPLOAD_DEDUP_MAX_ENTRIES,
+        ttl: float = settings.UPLOAD_DEDUP_TTL,
+    ):
+        self.client = client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (server, folder, image type, name) -> (expiry, sha256 of its content, upload result)
+        self._known: "OrderedDict[Tuple, Tuple[float, str, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self.stats = {"uploads": 0, "deduplicated": 0, "bytes_uploaded": 0, "bytes_saved": 0}
+
+    @staticmethod
+    def content_name(digest: str, filename: Optional[str]) -> str:
+        extension = os.path.splitext(filename or "")[1].lower() or ".png"
+        return f"{digest[:32]}{extension}"
+
+    async def upload(
+        self,
+        server_address: str,
+        content: bytes,
+        filename: Optional[str] = None,
+        content_type: str = "image/png",
+        folder_type: str = "input",
+        image_type: str = "image",
+        keep_filename: bool = False,
+        overwrite: bool = True,
+    ) -> Dict[str, Any]:
+        """Uploads ``content`` unless the backend already has it; returns ComfyUI's upload result.
+
+        With ``keep_filename`` the caller's filename is used as-is (and becomes part of the key).
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        name = filename if keep_filename else self.content_name(digest, filename)
+        key = (server_address, folder_type, image_type, name)
+
+        known = self._known.get(key)
+        if known is not None and known[0] > time.monotonic() and known[1] == digest:
+            self._known.move_to_end(key)
+            self.stats["deduplicated"] += 1
+            self.stats["bytes_saved"] += len(content)
+            return known[2]
+
+        inflight_key = (*key, digest)
+        inflight = self._inflight.get(inflight_key)
+        if inflight is not None:
+            self.stats["deduplicated"] += 1
+            self.stats["bytes_saved"] += len(content)
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[inflight_key] = future
+        try:
+            result = await self.client.upload_image(
+                server_address,
+                name,
+                content,
+                content_type=content_type,
+                folder_type=folder_type,
+                image_type=image_type,
+                overwrite=overwrite,
+            )
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting on it.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._inflight.pop(inflight_key, None)
+
+        self.stats["uploads"] += 1
+        self.stats["bytes_uploaded"] += len(content)
+        if result.get("name", name) == name:
+            self._known[key] = (time.monotonic() + self.ttl, digest, result)
+            self._known.move_to_end(key)
+        else:
+            # Without overwrite ComfyUI stored the bytes under a new name; ``name`` is unchanged.
+            self._known.pop(key, None)
+        while len(self._known) > self.max_entries:
+            self._known.popitem(last=False)
+        logger.info(f"Uploaded {name} ({len(content)} bytes) to {server_address}")
+        return result
+
+    def forget(self, server_address: str):
+        """Drops everything known about a backend, e.g. after it was restarted."""
+        for key in [key for key in self._known if key[0] == server_address]:
+            del self._known[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "known_files": len(self._known)}
+
+
+upload_tracker = UploadTracker()
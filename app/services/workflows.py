@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_ASSETS_DIR = os.path.join(os.path.dirname(SERVICES_DIR), "static", "assets")
+
+# (node id, input name) each role of the bundled workflows is written to.
+TUTORIAL_ROLES = {
+    "positive_text": ("6", "text"),
+    "negative_text": ("7", "text"),
+    "seed": ("3", "seed"),
+    "steps": ("3", "steps"),
+    "width": ("5", "width"),
+    "height": ("5", "height"),
+    "batch_size": ("5", "batch_size"),
+    "checkpoint": ("4", "ckpt_name"),
+}
+
+# Roles a template must define to be usable by /inpaint.
+INPAINT_REQUIRED_ROLES = ("positive_text", "negative_text", "image", "mask")
+
+INPAINT_ROLES = {
+    "positive_text": ("59", "text"),
+    "negative_text": ("51", "text"),
+    "seed": ("50", "seed"),
+    "steps": ("50", "steps"),
+    "denoise": ("50", "denoise"),
+    "image": ("58", "image"),
+    "mask": ("62", "image"),
+    "checkpoint": ("57", "ckpt_name"),
+    "vae": ("55", "vae_name"),
+}
+
+# Loader node types and the inputs that name the model file they load.
+MODEL_LOADER_INPUTS = {
+    "CheckpointLoaderSimple": ("ckpt_name",),
+    "CheckpointLoader": ("ckpt_name",),
+    "VAELoader": ("vae_name",),
+    "UNETLoader": ("unet_name",),
+    "LoraLoader": ("lora_name",),
+    "ControlNetLoader": ("control_net_name",),
+}
+
+
+def workflow_models(graph: Dict[str, Any]) -> Tuple[str, ...]:
+    """Sorted model files a workflow loads; a backend that ran them last can skip the reload."""
+    models = set()
+    for node in graph.values():
+        for input_name in MODEL_LOADER_INPUTS.get(node.get("class_type"), ()):
+            value = node.get("inputs", {}).get(input_name)
+            if isinstance(value, str):
+                models.add(value)
+    return tuple(sorted(models))
+
+
+class WorkflowTemplate:
+    """A ComfyUI workflow loaded once and never mutated.
+
+    ``render`` hands out an independent copy with inputs patched by role name, so callers can
+    never leak edits into the shared template or into each other's requests.
+    """
+
+    def __init__(
+        self, name: str, graph: Dict[str, Any], roles: Dict[str, Tuple[str, str]], output_node: str, builtin: bool = True
+    ):
+        if not isinstance(graph, dict) or not graph or not all(
+            isinstance(node, dict) and isinstance(node.get("inputs", {}), dict) for node in graph.values()
+        ):
+            raise ValueError(f"Workflow '{name}' must be a ComfyUI API-format graph")
+        for role, (node_id, input_name) in roles.items():
+            if input_name not in graph.get(node_id, {}).get("inputs", {}):
+                raise ValueError(f"Workflow '{name}' has no input {node_id}.{input_name} for role '{role}'")
+        if output_node not in graph:
+            raise ValueError(f"Workflow '{name}' has no output node {output_node}")
+        self.name = name
+        self.roles = {role: tuple(target) for role, target in roles.items()}
+        self.output_node = output_node
+        self.builtin = builtin
+        self.models = workflow_models(graph)
+        # Kept serialized: json.loads is the cheapest way to get a fully independent copy.
+        self._serialized = json.dumps(graph)
+
+    def render(self, **values: Any) -> Dict[str, Any]:
+        """Returns a fresh copy of the graph with the given roles set; ``None`` values are skipped."""
+        graph = json.loads(self._serialized)
+        for role, value in values.items():
+            if value is None:
+                continue
+            try:
+                node_id, input_name = self.roles[role]
+            except KeyError:
+                raise ValueError(f"Workflow '{self.name}' has no role '{role}'")
+            graph[node_id]["inputs"][input_name] = value
+        return graph
+
+    def has_roles(self, *roles: str) -> bool:
+        return all(role in self.roles for role in roles)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "roles": sorted(self.roles),
+            "output_node": self.output_node,
+            "builtin": self.builtin,
+            "models": list(self.models),
+        }
+
+
+class WorkflowRegistry:
+    """Named workflow templates: the bundled ones loaded at startup plus client-registered ones."""
+
+    def __init__(self, max_custom: int = settings.WORKFLOW_MAX_CUSTOM):
+        self.max_custom = max_custom
+        self._templates: Dict[str, WorkflowTemplate] = {}
+
+    def register(self, template: WorkflowTemplate) -> WorkflowTemplate:
+        self._templates[template.name] = template
+        return template
+
+    def get(self, name: str) -> WorkflowTemplate:
+        try:
+            return self._templates[name]
+        except KeyError:
+            raise KeyError(f"Unknown workflow template '{name}'")
+
+    def register_custom(
+        self,
+        graph: Dict[str, Any],
+        roles: Dict[str, Tuple[str, str]],
+        output_node: str,
+        name: Optional[str] = None,
+    ) -> WorkflowTemplate:
+        """Registers a client workflow; raises ``ValueError`` if it is invalid or clashes.
+
+        Without a name the id is derived from the graph and roles, so registering the same
+        workflow again returns the same id.
+        """
+        if not all(isinstance(target, (list, tuple)) and len(target) == 2 for target in roles.values()):
+            raise ValueError("Each role must map to [node id, input name]")
+        if name is None:
+            canonical = json.dumps([graph, roles, output_node], sort_keys=True, separators=(",", ":"))
+            name = "wf_" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+        existing = self._templates.get(name)
+        if existing is not None and existing.builtin:
+            raise ValueError(f"Workflow '{name}' is built in and cannot be replaced")
+        if existing is None and sum(not t.builtin for t in self._templates.values()) >= self.max_custom:
+            raise ValueError(f"At most {self.max_custom} custom workflows can be registered")
+        return self.register(WorkflowTemplate(name, graph, roles, output_node, builtin=False))
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [template.to_dict() for template in self._templates.values()]
+
+    def load_defaults(self):
+        with open(os.path.join(SERVICES_DIR, "tutorial.json"), "r") as file:
+            tutorial = json.load(file)["prompt"]
+        self.register(WorkflowTemplate("tutorial", tutorial, TUTORIAL_ROLES, output_node="9"))
+
+        with open(os.path.join(STATIC_ASSETS_DIR, "inpaint_api.json"), "r") as file:
+            inpaint = json.load(file)
+        self.register(WorkflowTemplate("inpaint", inpaint, INPAINT_ROLES, output_node="60"))
+        logger.info(f"Loaded workflow templates: {', '.join(self._templates)}")
+
+
+workflow_registry = WorkflowRegistry()
+workflow_registry.load_defaults()
+
+
+# Seed input of each sampler type, used when expanding a workflow into seed variants.
+SAMPLER_SEED_INPUTS = {"KSampler": "seed", "KSamplerAdvanced": "noise_seed"}
+
+
+def _is_link(value: Any) -> bool:
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and isinstance(value[1], int)
+
+
+def _output_nodes(graph: Dict[str, Any], node_ids) -> List[str]:
+    return sorted((node_id for node_id in node_ids if graph[node_id].get("class_type") == "SaveImage"), key=str)
+
+
+def with_batch_size(graph: Dict[str, Any], count: int) -> Tuple[Dict[str, Any], List[str]]:
+    """Returns a copy that samples ``count`` latents in one batch, plus its SaveImage node ids."""
+    graph = json.loads(json.dumps(graph))
+    latents = [node for node in graph.values() if node.get("class_type") == "EmptyLatentImage"]
+    if not latents:
+        raise ValueError("Workflow has no EmptyLatentImage node to batch")
+    for node in latents:
+        node["inputs"]["batch_size"] = count
+    return graph, _output_nodes(graph, graph)
+
+
+def with_seed_variants(graph: Dict[str, Any], count: int) -> Tuple[Dict[str, Any], List[str]]:
+    """Returns a copy with ``count`` sampler chains that differ only in seed.
+
+    Everything upstream of the samplers (checkpoint, text encodes, latents) is shared, so the
+    variants run as a single queue entry and ComfyUI evaluates the shared nodes once. Output
+    node ids are returned grouped by variant.
+    """
+    samplers = {node_id for node_id, node in graph.items() if node.get("class_type") in SAMPLER_SEED_INPUTS}
+    if not samplers:
+        raise ValueError("Workflow has no KSampler node to vary")
+
+    downstream = set(samplers)
+    changed = True
+    while changed:
+        changed = False
+        for node_id, node in graph.items():
+            if node_id in downstream:
+                continue
+            if any(_is_link(value) and value[0] in downstream for value in node.get("inputs", {}).values()):
+                downstream.add(node_id)
+                changed = True
+
+    result = json.loads(json.dumps(graph))
+    outputs = _output_nodes(graph, downstream)
+    variant_outputs = list(outputs)
+    for index in range(1, count):
+        for node_id in downstream:
+            node = json.loads(json.dumps(graph[node_id]))
+            inputs = node.get("inputs", {})
+            for name, value in inputs.items():
+                if _is_link(value) and value[0] in downstream:
+                    inputs[name] = [f"{value[0]}_{index}", value[1]]
+            seed_input = SAMPLER_SEED_INPUTS.get(node.get("class_type"))
+            if seed_input and isinstance(inputs.get(seed_input), int):
+                inputs[seed_input] = (inputs[seed_input] + index) % (2 ** 64)
+            result[f"{node_id}_{index}"] = node
+        variant_outputs.extend(f"{node_id}_{index}" for node_id in outputs)
+    return result, variant_outputs
@@ -81,11 +81,6 @@ sendToComfyBtn.addEventListener("click", async () => {
     }
 
     try {
-        // Fetch the existing workflow JSON
-        const workflowResponse = await fetch("./assets/inpaint_api.json");
-        if (!workflowResponse.ok) throw new Error("Failed to load workflow JSON");
-        const jsonBlob = await workflowResponse.blob();
-
         // Convert canvas (mask) to a Blob
         const maskBlob = await new Promise(resolve => canvas.toBlob(resolve, "image/png"));
         const imageFile = imageInput.files[0];
@@ -98,7 +93,7 @@ sendToComfyBtn.addEventListener("click", async () => {
         const formData = new FormData();
         formData.append("positive_prompt", positivePrompt);
         formData.append("negative_prompt", negativePrompt);
-        formData.append("prompt_file", jsonBlob, "inpaint_api.json");
+        formData.append("workflow", "inpaint");
         formData.append("image", imageFile, "uploaded_image.png");
         formData.append("mask", maskBlob, "mask.png");
 
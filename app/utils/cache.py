@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Small LRU cache whose entries expire ``ttl`` seconds after they were stored."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "max_size": self.max_size}
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one in-flight operation.
+
+    The first caller starts ``call()`` as a task; callers arriving before it finishes await the
+    same task and get its result or exception. Nothing is kept once it finishes, so this only
+    removes duplicate concurrent work and never serves old results. If every waiter goes away
+    (e.g. all clients disconnected) the shared task is cancelled.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.create_task(call()))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.stats["calls"] += 1
+        else:
+            self.stats["coalesced"] += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "in_flight": len(self._flights)}
+
+
+class StaleWhileRevalidateCache:
+    """Async cache that keeps serving an expired entry while one background task refreshes it.
+
+    Entries are fresh for ``ttl`` seconds. Until ``stale_ttl`` seconds after being stored they
+    are still returned immediately, and the first such read schedules a refresh. Older entries
+    are treated as misses; concurrent misses on one key share a single fetch.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, max_size: int = 256):
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+        self._flights = SingleFlight()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_failures": 0}
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            stored_at, value = entry
+            age = now - stored_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+            if age < self.stale_ttl:
+                self._entries.move_to_end(key)
+                self.stats["stale_hits"] += 1
+                if key not in self._refreshing:
+                    self._refreshing[key] = asyncio.create_task(self._refresh(key, fetch))
+                return value
+
+        self.stats["misses"] += 1
+        return await self._flights.do(key, lambda: self._fetch_and_store(key, fetch))
+
+    async def _fetch_and_store(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        value = await fetch()
+        self._store(key, value)
+        return value
+
+    async def _refresh(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]):
+        try:
+            self._store(key, await fetch())
+            self.stats["refreshes"] += 1
+        except Exception as e:
+            self.stats["refresh_failures"] += 1
+            logger.warning(f"Background refresh of {key} failed: {str(e)}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    def _store(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "coalesced": self._flights.stats["coalesced"],
+            "size": len(self._entries),
+            "refreshing": len(self._refreshing),
+        }
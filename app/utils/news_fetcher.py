@@ -1,17 +1,42 @@
 from pygooglenews import GoogleNews
 from app.models.schemas import Article, NewsResponse
+from app.core.config import settings
+from app.core.metrics import track
+from app.utils.cache import StaleWhileRevalidateCache
+from functools import lru_cache
+from typing import Dict, List, Tuple
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
-def fetch_google_news(category: str, lang: str, country: str, limit: int) -> NewsResponse:
+NEWS_CATEGORIES = ("WORLD", "NATION", "BUSINESS", "TECHNOLOGY", "ENTERTAINMENT", "SPORTS", "SCIENCE", "HEALTH")
+
+# Whole parsed feeds keyed by (kind, category/topic, lang, country); ``limit`` is applied on read.
+news_cache = StaleWhileRevalidateCache(
+    ttl=settings.NEWS_CACHE_TTL,
+    stale_ttl=settings.NEWS_CACHE_STALE_TTL,
+    max_size=settings.NEWS_CACHE_SIZE,
+)
+
+@lru_cache(maxsize=64)
+def _google_news(lang: str, country: str) -> GoogleNews:
+    return GoogleNews(lang=lang, country=country)
+
+async def _timed_fetch(stage: str, fetch, *args) -> NewsResponse:
+    with track(stage):
+        return await asyncio.to_thread(fetch, *args)
+
+def _limit(news: NewsResponse, limit: int) -> NewsResponse:
+    return NewsResponse(feed_title=news.feed_title, articles=news.articles[:limit])
+
+def _fetch_category_feed(category: str, lang: str, country: str) -> NewsResponse:
     try:
-        logger.info(f"Fetching trends: category={category}, lang={lang}, country={country}, limit={limit}")
-        gn = GoogleNews(lang=lang, country=country)
-        news_feed = gn.topic_headlines(category.upper())
+        logger.info(f"Fetching trends: category={category}, lang={lang}, country={country}")
+        news_feed = _google_news(lang, country).topic_headlines(category.upper())
 
         articles = []
-        for entry in news_feed["entries"][:limit]:
+        for entry in news_feed["entries"]:
             title = entry["title"].split(" - ")[0].strip()
             articles.append(
                 Article(
@@ -27,22 +52,16 @@ def fetch_google_news(category: str, lang: str, country: str, limit: int) -> New
         logger.error(f"Error fetching news: {str(e)}")
         raise Exception(f"Error fetching news: {str(e)}")
 
-def fetch_trends_by_topic(
-    topic_name: str,
-    lang: str = "en",
-    country: str = "WORLD",
-    limit: int = 10
-) -> NewsResponse:
+def _fetch_topic_feed(topic_name: str, lang: str, country: str) -> NewsResponse:
     try:
-        logger.info(f"Fetching trends for topic '{topic_name}' with lang={lang}, country={country}, limit={limit}")
-        gn = GoogleNews(lang=lang, country=country)
-        search_results = gn.search(query=topic_name)
+        logger.info(f"Fetching trends for topic '{topic_name}' with lang={lang}, country={country}")
+        search_results = _google_news(lang, country).search(query=topic_name)
         if not isinstance(search_results, dict) or "entries" not in search_results or not search_results["entries"]:
             logger.warning(f"No news data available for topic '{topic_name}'")
             raise Exception("No news data available for the given topic and parameters.")
 
         articles = []
-        for entry in search_results["entries"][:limit]:
+        for entry in search_results["entries"]:
             if not all(key in entry for key in ["title", "link", "published", "source"]):
                 logger.warning(f"Skipping malformed entry: {entry}")
                 continue
@@ -66,4 +85,75 @@ def fetch_trends_by_topic(
         )
     except Exception as e:
         logger.error(f"Error fetching topic trends for '{topic_name}': {str(e)}")
-        raise Exception(f"Error fetching news: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error fetching news: {str(e)}")
+
+def fetch_google_news(category: str, lang: str, country: str, limit: int) -> NewsResponse:
+    return _limit(_fetch_category_feed(category, lang, country), limit)
+
+def fetch_trends_by_topic(
+    topic_name: str,
+    lang: str = "en",
+    country: str = "WORLD",
+    limit: int = 10
+) -> NewsResponse:
+    return _limit(_fetch_topic_feed(topic_name, lang, country), limit)
+
+async def get_google_news(category: str, lang: str, country: str, limit: int) -> NewsResponse:
+    """Cached fetch_google_news: stale feeds are served at once and refreshed in the background."""
+    key = ("category", category.upper(), lang, country)
+    news = await news_cache.get_or_fetch(key, lambda: _timed_fetch("news_category", _fetch_category_feed, category, lang, country))
+    return _limit(news, limit)
+
+async def get_trends_by_topic(
+    topic_name: str,
+    lang: str = "en",
+    country: str = "WORLD",
+    limit: int = 10
+) -> NewsResponse:
+    """Cached fetch_trends_by_topic, keyed by the normalised topic."""
+    key = ("topic", topic_name.strip().lower(), lang, country)
+    news = await news_cache.get_or_fetch(key, lambda: _timed_fetch("news_topic", _fetch_topic_feed, topic_name, lang, country))
+    return _limit(news, limit)
+
+async def get_many(
+    categories: List[str],
+    topics: List[str],
+    lang: str = "en",
+    country: str = "WORLD",
+    limit: int = 10,
+    concurrency: int = settings.NEWS_FANOUT_CONCURRENCY,
+    timeout: float = settings.NEWS_FEED_TIMEOUT,
+) -> Tuple[Dict[str, NewsResponse], Dict[str, str]]:
+    """Fetches several category and topic feeds concurrently.
+
+    At most ``concurrency`` feeds are downloaded at once and each gets ``timeout`` seconds once
+    it starts. Returns ``(feeds, errors)`` keyed by "category:NAME" / "topic:name", so one slow
+    or broken feed never fails the rest. A feed that misses its deadline keeps downloading in the
+    background, holding its slot until it finishes, and lands in the cache for the next request.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    requests = [(f"category:{category.upper()}", get_google_news, category) for category in categories]
+    requests += [(f"topic:{topic}", get_trends_by_topic, topic) for topic in topics]
+
+    async def fetch(fetcher, name):
+        await semaphore.acquire()
+        try:
+            task = asyncio.ensure_future(fetcher(name, lang, country, limit))
+        except BaseException:
+            semaphore.release()
+            raise
+        task.add_done_callback(lambda _: semaphore.release())
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    results = await asyncio.gather(*(fetch(fetcher, name) for _, fetcher, name in requests), return_exceptions=True)
+    feeds, errors = {}, {}
+    for (key, _, _), result in zip(requests, results):
+        if isinstance(result, asyncio.TimeoutError):
+            errors[key] = f"Timed out after {timeout:g}s"
+        elif isinstance(result, Exception):
+            errors[key] = str(result)
+        else:
+            feeds[key] = result
+    if errors:
+        logger.warning(f"Trend fan-out returned {len(feeds)} feeds, {len(errors)} failed: {errors}")
+    return feeds, errors
@@ -0,0 +1,87 @@
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after ``failure_threshold`` consecutive failures.
+
+    While open, ``allow()`` is False until ``reset_timeout`` seconds have passed; then a single
+    probe call is let through (half-open). Its success closes the breaker, its failure opens it
+    again for another ``reset_timeout``. A probe that never reports back is replaced by a new
+    one after ``reset_timeout``.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls would be rejected; unlike ``allow()`` this never starts a probe."""
+        return self.state != "closed" and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self.opened_at = now
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit {self.name} closed")
+        self.state = "closed"
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit {self.name} opened after {self.consecutive_failures} failures")
+                self.stats["opened"] += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures, **self.stats}
+
+
+class LatencyWindow:
+    """Durations of the last ``size`` calls, for percentile-based timeouts.
+
+    Calls that timed out should be added at their timeout: the real duration is unknown but at
+    least that long, and leaving them out would make a degrading upstream look fast.
+    """
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The ``q`` quantile (0..1) of the window, or None until ``min_samples`` were seen."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"samples": len(self._samples), "p50": self.percentile(0.5), "p95": self.percentile(0.95), "p99": self.percentile(0.99)}
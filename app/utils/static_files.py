@@ -0,0 +1,155 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, List
+
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# Files that reference other assets; they are fingerprinted after the files they point to.
+REWRITTEN_EXTENSIONS = (".css", ".js", ".html")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+class StaticAsset:
+    """One file held in memory with its gzip and brotli encodings."""
+
+    def __init__(self, path: str, content: bytes, media_type: str):
+        self.path = path
+        self.media_type = media_type
+        self.digest = hashlib.sha256(content).hexdigest()
+        self.encodings: Dict[str, bytes] = {"identity": content}
+        if media_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(content, compresslevel=9, mtime=0)
+            if len(compressed) < len(content):
+                self.encodings["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(content, quality=11)
+                if len(compressed) < len(content):
+                    self.encodings["br"] = compressed
+
+    @property
+    def fingerprinted_path(self) -> str:
+        root, extension = os.path.splitext(self.path)
+        return f"{root}.{self.digest[:12]}{extension}"
+
+
+def _accepted_encodings(accept_encoding: str) -> List[str]:
+    accepted = []
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q=") and quality[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        if name:
+            accepted.append(name.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles:
+    """Serves a static directory from memory, fingerprinted and precompressed at startup.
+
+    Every file is reachable under its own path (revalidated on each use via ETag) and under a
+    content-hashed path such as ``script.3f2a1b9c0d4e.js`` that is cached for a year. HTML, JS
+    and CSS files have their references to other assets rewritten to the hashed paths, so a
+    repeat page load only revalidates the HTML. Brotli is preferred over gzip when the client
+    accepts it and the ``brotli`` package is installed.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._assets: Dict[str, StaticAsset] = {}
+        self._immutable: Dict[str, StaticAsset] = {}
+        self._load()
+
+    def _load(self):
+        paths = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                paths.append(os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, "/"))
+        # Plain files first, then CSS/JS, then HTML, so references always point at final hashes.
+        order = {".css": 1, ".js": 1, ".html": 2}
+        for path in sorted(paths, key=lambda path: (order.get(os.path.splitext(path)[1].lower(), 0), path)):
+            with open(os.path.join(self.directory, path), "rb") as file:
+                content = file.read()
+            if path.lower().endswith(REWRITTEN_EXTENSIONS):
+                content = self._rewrite_references(path, content)
+            media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            if media_type.startswith("text/") or media_type in ("application/javascript", "application/json"):
+                media_type += "; charset=utf-8"
+            asset = StaticAsset(path, content, media_type)
+            self._assets[path] = asset
+            self._immutable[asset.fingerprinted_path] = asset
+        logger.info(f"Loaded {len(self._assets)} static assets from {self.directory}")
+
+    def _rewrite_references(self, path: str, content: bytes) -> bytes:
+        try:
+            text = content.decode("utf-8")
+        except UnicodeDecodeError:
+            return content
+        base = os.path.dirname(path)
+        for target, asset in self._assets.items():
+            relative = os.path.relpath(target, base or ".").replace(os.sep, "/")
+            hashed_relative = os.path.relpath(asset.fingerprinted_path, base or ".").replace(os.sep, "/")
+            replacements = {
+                f"/static/{target}": f"/static/{asset.fingerprinted_path}",
+                f"./{relative}": f"./{hashed_relative}",
+            }
+            for old, new in replacements.items():
+                text = re.sub(rf"""(["'`]){re.escape(old)}(["'`?#])""", rf"\g<1>{new}\g<2>", text)
+        return text.encode("utf-8")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            await PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})(scope, receive, send)
+            return
+
+        path, root_path = scope["path"], scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        path = path.lstrip("/")
+        asset = self._immutable.get(path)
+        cache_control = IMMUTABLE
+        if asset is None:
+            asset = self._assets.get(path)
+            cache_control = REVALIDATE
+        if asset is None:
+            await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        encoding = "identity"
+        accepted = _accepted_encodings(headers.get("accept-encoding", ""))
+        for candidate in ("br", "gzip"):
+            if candidate in asset.encodings and candidate in accepted:
+                encoding = candidate
+                break
+        suffix = "" if encoding == "identity" else f"-{encoding}"
+        etag = f'"{asset.digest[:32]}{suffix}"'
+        response_headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+
+        if_none_match = headers.get("if-none-match", "")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+            response = Response(status_code=304, headers=response_headers)
+        else:
+            body = asset.encodings[encoding]
+            response = Response(content=b"" if scope["method"] == "HEAD" else body, media_type=asset.media_type, headers=response_headers)
+            response.headers["Content-Length"] = str(len(body))
+        await response(scope, receive, send)
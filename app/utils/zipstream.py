@@ -0,0 +1,42 @@
+import zipfile
+from typing import AsyncIterator, Tuple
+
+
+class _ZipBuffer:
+    """Write-only sink for ZipFile that hands written bytes back to the caller in chunks."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_zip(files: AsyncIterator[Tuple[str, AsyncIterator[bytes]]]) -> AsyncIterator[bytes]:
+    """Streams a zip archive of (name, chunks) entries without holding any entry in memory.
+
+    Entries are stored uncompressed: the payloads are PNGs, which do not compress further.
+    """
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        async for name, chunks in files:
+            with archive.open(name, "w") as entry:
+                async for chunk in chunks:
+                    entry.write(chunk)
+                    yield buffer.drain()
+            yield buffer.drain()
+    yield buffer.drain()
@@ -0,0 +1,40 @@
+"""Runs the API for benchmarks with Google News replaced by a synthetic feed.
+
+The trend feeds are the only upstream the fake ComfyUI server cannot stand in for, so they
+are generated locally after ``--news-delay`` seconds. Everything else is the real app.
+
+    COMFYUI_SERVER_ADDRESS=127.0.0.1:8188 python -m bench.app_server --port 8000
+"""
+import argparse
+import time
+
+from app.main import app
+from app.models.schemas import Article, NewsResponse
+from app.utils import news_fetcher
+
+NEWS_DELAY = 0.2
+
+
+def fake_feed(name: str, lang: str, country: str) -> NewsResponse:
+    time.sleep(NEWS_DELAY)
+    articles = [
+        Article(title=f"{name} headline {index}", link=f"https://example.com/{index}", published="Mon, 01 Jan 2024", source="Bench")
+        for index in range(50)
+    ]
+    return NewsResponse(feed_title=f"{name} - Google News", articles=articles)
+
+
+news_fetcher._fetch_category_feed = fake_feed
+news_fetcher._fetch_topic_feed = fake_feed
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--news-delay", type=float, default=NEWS_DELAY, help="seconds a synthetic feed takes to fetch")
+    args = parser.parse_args()
+    NEWS_DELAY = args.news_delay
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
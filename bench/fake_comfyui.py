@@ -0,0 +1,218 @@
+"""Stand-in ComfyUI server for benchmarks.
+
+Implements the parts of the ComfyUI API this service uses: /prompt, /history, /view,
+/upload/image, /queue and the /ws event stream. Prompts run one at a time like a single-GPU
+ComfyUI and take ``--delay`` seconds; every SaveImage node returns a real PNG of
+``--image-size`` x ``--image-size`` noise. Like ComfyUI, nodes whose inputs (and upstream
+nodes) are unchanged since the previous prompt are reported as cached and take no time.
+
+    python -m bench.fake_comfyui --port 8188 --delay 0.5 --image-size 512
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import struct
+import uuid
+import zlib
+from collections import OrderedDict
+
+from fastapi import FastAPI, File, Form, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
+
+DELAY = float(os.getenv("FAKE_COMFYUI_DELAY", "0.5"))
+IMAGE_SIZE = int(os.getenv("FAKE_COMFYUI_IMAGE_SIZE", "512"))
+PARALLEL = int(os.getenv("FAKE_COMFYUI_PARALLEL", "1"))
+MAX_HISTORY = 10000
+
+
+def make_png(size: int) -> bytes:
+    """An RGB PNG of random pixels, so it neither compresses nor caches unrealistically well."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    raw = b"".join(b"\x00" + os.urandom(size * 3) for _ in range(size))
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+app = FastAPI(title="Fake ComfyUI")
+state = {
+    "image": None,
+    "queue": None,
+    "running": [],
+    "history": OrderedDict(),
+    "sockets": {},
+    "uploads": 0,
+    "cache": set(),
+}
+
+
+def node_signatures(prompt: dict) -> dict:
+    """Per node, a hash of its class, inputs and the signatures of the nodes it links to."""
+    signatures = {}
+
+    def signature(node_id: str) -> str:
+        if node_id not in signatures:
+            node = prompt[node_id]
+            inputs = {
+                name: signature(value[0]) if isinstance(value, list) and len(value) == 2 and value[0] in prompt else value
+                for name, value in node.get("inputs", {}).items()
+            }
+            payload = json.dumps([node.get("class_type"), inputs], sort_keys=True)
+            signatures[node_id] = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return signatures[node_id]
+
+    for node_id in prompt:
+        signature(node_id)
+    return signatures
+
+
+async def send(client_id: str, event: str, data: dict):
+    websocket = state["sockets"].get(client_id)
+    if websocket is not None:
+        try:
+            await websocket.send_text(json.dumps({"type": event, "data": data}))
+        except Exception:
+            state["sockets"].pop(client_id, None)
+
+
+async def execute(prompt_id: str, prompt: dict, client_id: str):
+    state["running"].append(prompt_id)
+    try:
+        signatures = node_signatures(prompt)
+        cached = sorted(node_id for node_id in prompt if signatures[node_id] in state["cache"])
+        state["cache"] = set(signatures.values())
+        await send(client_id, "execution_start", {"prompt_id": prompt_id})
+        await send(client_id, "execution_cached", {"prompt_id": prompt_id, "nodes": cached})
+        steps = 4
+        for step in range(1, steps + 1):
+            await asyncio.sleep(DELAY * (1 - len(cached) / max(len(prompt), 1)) / steps)
+            await send(client_id, "progress", {"prompt_id": prompt_id, "node": "3", "value": step, "max": steps})
+
+        batch_size = 1
+        for node in prompt.values():
+            if node.get("class_type") == "EmptyLatentImage":
+                batch_size = node.get("inputs", {}).get("batch_size", 1)
+        outputs = {
+            node_id: {"images": [
+                {"filename": f"ComfyUI_{prompt_id[:8]}_{index:05d}_.png", "subfolder": "", "type": "output"}
+                for index in range(batch_size)
+            ]}
+            for node_id, node in prompt.items() if node.get("class_type") == "SaveImage"
+        }
+        state["history"][prompt_id] = {
+            "prompt": [0, prompt_id, prompt, {}, list(outputs)],
+            "outputs": outputs,
+            "status": {
+                "status_str": "success",
+                "completed": True,
+                "messages": [["execution_cached", {"nodes": cached, "prompt_id": prompt_id}]],
+            },
+        }
+        while len(state["history"]) > MAX_HISTORY:
+            state["history"].popitem(last=False)
+    finally:
+        state["running"].remove(prompt_id)
+    await send(client_id, "execution_success", {"prompt_id": prompt_id})
+    await send(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+
+
+async def worker():
+    while True:
+        prompt_id, prompt, client_id = await state["queue"].get()
+        try:
+            await execute(prompt_id, prompt, client_id)
+        finally:
+            state["queue"].task_done()
+
+
+@app.on_event("startup")
+async def startup():
+    state["image"] = make_png(IMAGE_SIZE)
+    state["queue"] = asyncio.Queue()
+    for _ in range(PARALLEL):
+        asyncio.create_task(worker())
+
+
+@app.post("/prompt")
+async def queue_prompt(request: Request):
+    body = await request.json()
+    prompt_id = str(uuid.uuid4())
+    state["queue"].put_nowait((prompt_id, body["prompt"], body.get("client_id", "")))
+    return {"prompt_id": prompt_id, "number": state["queue"].qsize(), "node_errors": {}}
+
+
+@app.get("/queue")
+async def get_queue():
+    pending = [[0, prompt_id, {}, {}, []] for prompt_id, _, _ in list(state["queue"]._queue)]
+    return {"queue_running": [[0, prompt_id, {}, {}, []] for prompt_id in state["running"]], "queue_pending": pending}
+
+
+@app.get("/history")
+async def get_history():
+    return dict(state["history"])
+
+
+@app.get("/history/{prompt_id}")
+async def get_history_entry(prompt_id: str):
+    entry = state["history"].get(prompt_id)
+    return {prompt_id: entry} if entry is not None else {}
+
+
+@app.get("/view")
+async def view(request: Request, filename: str, subfolder: str = "", type: str = "output"):
+    image = state["image"]
+    headers = {"Accept-Ranges": "bytes", "Content-Disposition": f'filename="{filename}"'}
+    range_header = request.headers.get("range", "")
+    if range_header.startswith("bytes="):
+        start, _, end = range_header[6:].partition("-")
+        start, end = int(start or 0), int(end) if end else len(image) - 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(image)}"
+        return Response(image[start:end + 1], status_code=206, media_type="image/png", headers=headers)
+    return Response(image, media_type="image/png", headers=headers)
+
+
+@app.post("/upload/image")
+async def upload_image(image: UploadFile = File(...), type: str = Form("input"), overwrite: str = Form("false")):
+    await image.read()
+    state["uploads"] += 1
+    return {"name": image.filename, "subfolder": "", "type": type}
+
+
+@app.get("/system_stats")
+async def system_stats():
+    return JSONResponse({"system": {"os": "fake"}, "devices": []})
+
+
+@app.websocket("/ws")
+async def events(websocket: WebSocket, clientId: str = ""):
+    await websocket.accept()
+    client_id = clientId or str(uuid.uuid4())
+    state["sockets"][client_id] = websocket
+    await websocket.send_text(json.dumps({
+        "type": "status",
+        "data": {"status": {"exec_info": {"queue_remaining": state["queue"].qsize()}}, "sid": client_id},
+    }))
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        state["sockets"].pop(client_id, None)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--delay", type=float, default=DELAY, help="seconds each prompt takes to execute")
+    parser.add_argument("--image-size", type=int, default=IMAGE_SIZE, help="output image width and height in pixels")
+    parser.add_argument("--parallel", type=int, default=PARALLEL, help="prompts executed at the same time")
+    args = parser.parse_args()
+    DELAY, IMAGE_SIZE, PARALLEL = args.delay, args.image_size, args.parallel
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
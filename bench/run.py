@@ -0,0 +1,269 @@
+"""Load benchmark for /generate_image, /inpaint and /trends.
+
+With ``--spawn`` the fake ComfyUI server and the API are started as subprocesses on local
+ports; otherwise ``--base-url`` must point at a running API. Each scenario is driven at
+``--concurrency`` for ``--requests`` requests, and latency percentiles and throughput are
+printed and saved as JSON under ``--output``. ``--compare`` prints the change against an
+earlier result file.
+
+    python -m bench.run --spawn --concurrency 8 --requests 200
+    python -m bench.run --spawn --compare bench/results/<earlier>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TUTORIAL_PATH = os.path.join(ROOT, "app", "services", "tutorial.json")
+CATEGORIES = ["WORLD", "NATION", "BUSINESS", "TECHNOLOGY", "ENTERTAINMENT", "SPORTS", "SCIENCE", "HEALTH"]
+SCENARIOS = ("generate_image", "inpaint", "trends")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Scenario:
+    """Builds and sends one kind of request; ``unique`` defeats the server's result caches."""
+
+    def __init__(self, name: str, unique: bool):
+        self.name = name
+        self.unique = unique
+        with open(TUTORIAL_PATH, "r") as file:
+            self.tutorial = json.load(file)["prompt"]
+        from bench.fake_comfyui import make_png
+        self.image = make_png(64)
+        self.mask = make_png(64)
+
+    async def send(self, client: httpx.AsyncClient, index: int) -> httpx.Response:
+        if self.name == "generate_image":
+            workflow = json.loads(json.dumps(self.tutorial))
+            if self.unique:
+                workflow["3"]["inputs"]["seed"] = random.getrandbits(48)
+            return await client.post("/generate_image", json={"workflow_data": workflow})
+        if self.name == "inpaint":
+            image = self.image + (os.urandom(8) if self.unique else b"")
+            return await client.post(
+                "/inpaint",
+                data={
+                    "positive_prompt": f"a red door {index if self.unique else ''}",
+                    "negative_prompt": "blurry",
+                    "workflow": "inpaint",
+                },
+                files={
+                    "image": ("image.png", image, "image/png"),
+                    "mask": ("mask.png", self.mask, "image/png"),
+                },
+            )
+        if self.name == "trends":
+            return await client.get("/trends", params={"category": CATEGORIES[index % len(CATEGORIES)], "limit": 10})
+        raise ValueError(f"Unknown scenario {self.name}")
+
+
+async def drive(base_url: str, scenario: Scenario, concurrency: int, requests: int, timeout: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker():
+            for index in counter:
+                start = time.perf_counter()
+                try:
+                    response = await scenario.send(client, index)
+                    await response.aread()
+                    if response.status_code >= 400:
+                        key = f"HTTP {response.status_code}"
+                        errors[key] = errors.get(key, 0) + 1
+                        continue
+                except httpx.HTTPError as e:
+                    key = type(e).__name__
+                    errors[key] = errors.get(key, 0) + 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    """Waits for a 2xx from ``url``, an endpoint only the expected server has."""
+    deadline = time.monotonic() + timeout
+    last = "no response"
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            response = httpx.get(url, timeout=1)
+            if response.is_success:
+                return
+            last = f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            last = str(e) or type(e).__name__
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s ({last})")
+
+
+def spawn(args, workdir: str) -> List[subprocess.Popen]:
+    comfy = f"127.0.0.1:{args.comfy_port}"
+    output = None if args.verbose else subprocess.DEVNULL
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "bench.fake_comfyui", "--port", str(args.comfy_port),
+         "--delay", str(args.comfy_delay), "--image-size", str(args.image_size), "--parallel", str(args.comfy_parallel)],
+        cwd=ROOT,
+        stdout=output,
+        stderr=output,
+    )
+    wait_until_up(f"http://{comfy}/system_stats", fake)
+    env = {
+        **os.environ,
+        "COMFYUI_SERVER_ADDRESS": comfy,
+        "COMFYUI_BACKENDS": comfy,
+        "IMAGE_CACHE_DIR": os.path.join(workdir, "images"),
+        "CAMPAIGN_DIR": os.path.join(workdir, "campaigns"),
+    }
+    api = subprocess.Popen(
+        [sys.executable, "-m", "bench.app_server", "--port", str(args.port), "--news-delay", str(args.news_delay)],
+        cwd=ROOT,
+        env=env,
+        stdout=output,
+        stderr=output,
+    )
+    wait_until_up(f"http://127.0.0.1:{args.port}/backends", api)
+    return [api, fake]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Any]] = None):
+    header = f"{'scenario':<16}{'ok':>6}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        errors = sum(result["errors"].values())
+        print(
+            f"{name:<16}{result['succeeded']:>6}{errors:>6}{result['rps']:>9.1f}"
+            f"{result['p50'] * 1000:>10.1f}{result['p95'] * 1000:>10.1f}{result['p99'] * 1000:>10.1f}"
+        )
+        previous = (baseline or {}).get("results", {}).get(name)
+        if previous:
+            def delta(key: str) -> str:
+                return f"{(result[key] - previous[key]) / previous[key] * 100:+.1f}%" if previous[key] else "n/a"
+            print(f"{'  vs baseline':<28}{delta('rps'):>9}{delta('p50'):>10}{delta('p95'):>10}{delta('p99'):>10}")
+        if result["errors"]:
+            print(f"  errors: {result['errors']}")
+
+
+async def main_async(args) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for name in args.scenarios:
+        scenario = Scenario(name, unique=not args.cached)
+        if args.warmup:
+            await drive(args.base_url, scenario, min(args.concurrency, args.warmup), args.warmup, args.timeout)
+        results[name] = await drive(args.base_url, scenario, args.concurrency, args.requests, args.timeout)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=4, help="unmeasured requests per scenario first")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--cached", action="store_true", help="repeat identical requests so server caches are hit")
+    parser.add_argument("--base-url", default=None, help="API to benchmark; default is the spawned one")
+    parser.add_argument("--spawn", action="store_true", help="start the fake ComfyUI server and the API locally")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--comfy-port", type=int, default=8766)
+    parser.add_argument("--comfy-delay", type=float, default=0.5)
+    parser.add_argument("--comfy-parallel", type=int, default=1)
+    parser.add_argument("--image-size", type=int, default=512)
+    parser.add_argument("--news-delay", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="show the spawned servers' logs")
+    parser.add_argument("--output", default=os.path.join(ROOT, "bench", "results"))
+    parser.add_argument("--label", default="", help="appended to the result file name")
+    parser.add_argument("--compare", default=None, help="earlier result file to diff against")
+    args = parser.parse_args()
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if not args.spawn and not args.base_url:
+        parser.error("pass --spawn or --base-url")
+    if args.spawn and not args.base_url:
+        args.base_url = f"http://127.0.0.1:{args.port}"
+
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        try:
+            if args.spawn:
+                processes = spawn(args, workdir)
+            results = asyncio.run(main_async(args))
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait(timeout=10)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "params": {
+            key: getattr(args, key)
+            for key in ("scenarios", "concurrency", "requests", "cached", "comfy_delay", "comfy_parallel", "image_size", "news_delay")
+        },
+        "results": results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+    print_report(results, baseline)
+
+    os.makedirs(args.output, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    name = "-".join(part for part in (stamp, report["revision"], args.label) if part)
+    path = os.path.join(args.output, f"{name}.json")
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import asyncio
+
+from app.services.uploads import UploadTracker
+
+
+class FakeComfyUI:
+    def __init__(self):
+        self.files = {}
+        self.calls = 0
+
+    async def upload_image(self, server_address, filename, content, content_type="image/png",
+                           folder_type="input", image_type="image", overwrite=False, timeout=None):
+        self.calls += 1
+        self.files[(server_address, folder_type, filename)] = content
+        return {"name": filename, "subfolder": "", "type": folder_type}
+
+
+def upload(tracker, content):
+    return asyncio.run(tracker.upload("backend:8188", content, filename="x.png",
+                                      keep_filename=True, overwrite=True))
+
+
+def test_identical_upload_is_deduplicated():
+    client = FakeComfyUI()
+    tracker = UploadTracker(client=client)
+
+    upload(tracker, b"A")
+    upload(tracker, b"A")
+
+    assert client.calls == 1
+    assert tracker.stats["deduplicated"] == 1
+
+
+def test_overwritten_name_is_reuploaded():
+    client = FakeComfyUI()
+    tracker = UploadTracker(client=client)
+
+    upload(tracker, b"A")
+    upload(tracker, b"B")
+    upload(tracker, b"A")
+
+    assert client.calls == 3
+    assert client.files[("backend:8188", "input", "x.png")] == b"A"